@@ -0,0 +1,184 @@
+# app/admission_service.py
+"""
+Admission control for the inference endpoints. At most ADMISSION_MAX_CONCURRENCY
+analyses run at once per worker; up to ADMISSION_MAX_QUEUE more wait in FIFO order.
+Anything beyond that is refused at once with 503 and a Retry-After estimate, so an
+upload spike cannot pile up unbounded work and starve the cheap endpoints.
+"""
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+from app import metrics_service
+
+# Analyses running at once. Keep it at least PREDICT_MAX_BATCH_SIZE so batches can fill.
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 16))
+# Requests allowed to wait for a slot; more are rejected immediately
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 32))
+# Longest a request may wait for a slot before it is answered with 503
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 10))
+# How often waiting requests check whether their client is still connected
+DISCONNECT_POLL_SECONDS = 0.25
+
+# Status nginx uses for "client closed request"; only ever seen in logs and metrics
+CLIENT_CLOSED_REQUEST = 499
+
+
+def _overloaded(retry_after: int, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded, deadline-aware FIFO queue in front of it."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = deque()
+        # Moving average of how long an admitted request holds its slot, for Retry-After
+        self._avg_service_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained, at least 1."""
+        backlog = (len(self._waiters) + 1) / self.max_concurrency
+        return max(1, math.ceil(backlog * self._avg_service_seconds))
+
+    def is_saturated(self) -> bool:
+        return self.active >= self.max_concurrency and len(self._waiters) >= self.max_queue
+
+    def _reject(self, reason: str, detail: str):
+        metrics_service.admission_rejected.inc(self.name, reason)
+        raise _overloaded(self.retry_after(), detail)
+
+    async def _acquire(self, is_disconnected=None, deadline=None, within_admitted_request=False):
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            metrics_service.admission_wait.observe(self.name, value=0.0)
+            return
+        if not within_admitted_request and len(self._waiters) >= self.max_queue:
+            self._reject("queue_full", "Server is busy, try again shortly")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        metrics_service.admission_queued.set(self.name, value=len(self._waiters))
+        start = time.monotonic()
+        if deadline is None:
+            deadline = start + self.queue_timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reject("queue_timeout", "Server is busy, try again shortly")
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), min(remaining, DISCONNECT_POLL_SECONDS))
+                    break
+                except asyncio.TimeoutError:
+                    # Don't spend a slot on a client that already gave up
+                    if is_disconnected is not None and await is_disconnected():
+                        metrics_service.admission_rejected.inc(self.name, "client_gone")
+                        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed to us just as we gave up; pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        finally:
+            metrics_service.admission_queued.set(self.name, value=len(self._waiters))
+        metrics_service.admission_wait.observe(self.name, value=time.monotonic() - start)
+
+    def _release(self):
+        # Hand the slot straight to the oldest waiter, so arrivals can't jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self, is_disconnected=None, deadline=None, within_admitted_request=False):
+        """
+        Holds a slot for the duration of the block. Raises HTTPException 503 (with
+        Retry-After) when the queue is full or the wait exceeds the queue timeout.
+        `is_disconnected` is an async callable, e.g. Request.is_disconnected, checked
+        while waiting so abandoned requests leave the queue.
+
+        `deadline` (a time.monotonic() value) replaces the queue timeout. Parts of a
+        request that was already let in, such as the images of a batch, pass
+        `within_admitted_request=True`: they always join the queue, even a full one,
+        because turning them away would fail work the server already accepted.
+        """
+        await self._acquire(is_disconnected, deadline, within_admitted_request)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self._avg_service_seconds += 0.1 * (elapsed - self._avg_service_seconds)
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "avg_service_seconds": self._avg_service_seconds,
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that turns POSTs to the given paths away with 503 while their
+    controller is saturated, before the request body is read. FastAPI parses a
+    multipart upload completely before the endpoint runs, so without this a rejected
+    upload would still cost its whole transfer. Requests let through still wait for a
+    slot in the endpoint as usual.
+    """
+
+    def __init__(self, app, paths: dict):
+        self.app = app
+        self.paths = paths  # path -> AdmissionController
+
+    async def __call__(self, scope, receive, send):
+        controller = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            controller = self.paths.get(scope["path"])
+        if controller is not None and controller.is_saturated():
+            metrics_service.admission_rejected.inc(controller.name, "queue_full")
+            response = JSONResponse(
+                {"detail": "Server is busy, try again shortly"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(controller.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+inference_admission = AdmissionController(
+    "inference",
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
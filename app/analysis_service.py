@@ -0,0 +1,165 @@
+# app/analysis_service.py
+import os
+import time
+import asyncio
+from PIL import UnidentifiedImageError
+from fastapi import HTTPException, status
+
+from app import prediction_service, severity_service, preprocessing_service, executor_service, metrics_service
+from app.cache_service import analysis_cache, content_key, perceptual_hash
+
+# --- Batch analysis configuration ---
+# Images analyzed at once by one batch request; also bounds how many uploads are held in memory
+BATCH_ANALYSIS_CONCURRENCY = int(os.getenv("BATCH_ANALYSIS_CONCURRENCY", 4))
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", 200))
+MAX_BATCH_IMAGE_BYTES = int(os.getenv("MAX_BATCH_IMAGE_BYTES", 20 * 1024 * 1024))
+# Longest a batch request may spend waiting for admission slots for its images; images
+# still waiting when it runs out are reported as skipped
+BATCH_ADMISSION_TIMEOUT_SECONDS = float(os.getenv("BATCH_ADMISSION_TIMEOUT_SECONDS", 300))
+
+
+async def analyze_image(image_bytes: bytes) -> dict:
+    """
+    Full /analyze-plant/ pipeline for one upload: cache lookup, decode, then disease
+    prediction and severity analysis in parallel. Returns the raw (unformatted)
+    disease_name, confidence and severity values.
+    """
+    with metrics_service.in_flight.track("analysis"), metrics_service.timed("analysis"):
+        return await _analyze_image(image_bytes)
+
+
+async def _analyze_image(image_bytes: bytes) -> dict:
+    key = await executor_service.run_in_pool("preprocess", _timed_content_key, image_bytes)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Decode once and share the result between both services
+    image = await executor_service.run_in_pool("preprocess", preprocessing_service.prepare_image, image_bytes)
+
+    phash = None
+    if analysis_cache.near_duplicates_enabled:
+        phash = perceptual_hash(image.tensor)
+        cached = analysis_cache.get_similar(phash)
+        if cached is not None:
+            # Remember the exact bytes too, so a retry of this upload is an exact hit
+            analysis_cache.put(key, cached)
+            return cached
+
+    # Inference and the color segmentation are CPU-bound, so run them off the event loop
+    # in parallel. The segmentation does not depend on the disease; only the final
+    # (cheap) scoring uses the predicted disease's HSV profile.
+    result, severity_codes = await asyncio.gather(
+        executor_service.run_in_pool("inference", prediction_service.predict_disease, image),
+        executor_service.run_in_pool("severity", severity_service.encode_image, image),
+    )
+    severity = severity_service.severity_from_codes(severity_codes, result["disease_name"])
+
+    analysis = {
+        "disease_name": result["disease_name"],
+        "confidence": result["confidence"],
+        "severity": severity,
+    }
+    analysis_cache.put(key, analysis, phash)
+    return analysis
+
+
+def _timed_content_key(image_bytes: bytes) -> str:
+    with metrics_service.timed("hash"):
+        return content_key(image_bytes)
+
+
+def format_analysis(analysis: dict) -> dict:
+    """The /analyze-plant/ response body for an analysis result."""
+    return {
+        "disease_name": analysis["disease_name"],
+        "confidence": f"{analysis['confidence']:.2%}",
+        "severity_percentage": f"{analysis['severity']:.2f}%"
+    }
+
+
+async def analyze_sources(
+    sources,
+    concurrency: int = BATCH_ANALYSIS_CONCURRENCY,
+    admission=None,
+    is_disconnected=None,
+    admission_timeout: float = BATCH_ADMISSION_TIMEOUT_SECONDS,
+):
+    """
+    Async generator over many images, yielding one result dict per image as soon as
+    it completes (so not necessarily in input order; each carries its index).
+    `sources` yields (filename, load) pairs, where load() returns the image bytes and
+    is only called when a slot frees up, so at most `concurrency` images are in memory.
+    With an `admission` controller, every image also waits in its FIFO queue for a
+    slot, until `admission_timeout` seconds after the batch started or until
+    `is_disconnected()` reports the client gone.
+    """
+    deadline = time.monotonic() + admission_timeout
+
+    async def run(index: int, filename: str, load):
+        result = {"index": index, "filename": filename}
+        try:
+            image_bytes = await asyncio.to_thread(load)
+            if len(image_bytes) > MAX_BATCH_IMAGE_BYTES:
+                raise ValueError(f"image larger than {MAX_BATCH_IMAGE_BYTES} bytes")
+            if admission is not None:
+                async with admission.admit(is_disconnected, deadline=deadline, within_admitted_request=True):
+                    analysis = await analyze_image(image_bytes)
+            else:
+                analysis = await analyze_image(image_bytes)
+            result.update(format_analysis(analysis))
+            result["_analysis"] = analysis
+        except UnidentifiedImageError:
+            result["error"] = "not a readable image"
+        except HTTPException as e:
+            if e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+                # Waited for an admission slot until the batch deadline; the image itself may be fine
+                result["error"] = "skipped: server busy, no analysis slot before the batch deadline"
+                result["skipped"] = True
+            else:
+                result["error"] = e.detail
+        except Exception as e:
+            result["error"] = str(e) or type(e).__name__
+        return result
+
+    pending = set()
+    try:
+        for index, (filename, load) in enumerate(sources):
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.ensure_future(run(index, filename, load)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # The client went away mid-stream; stop the images that have not finished
+        for task in pending:
+            task.cancel()
+
+
+def summarize_field(analyses: list, failed: int = 0, skipped: int = 0) -> dict:
+    """
+    Field-level aggregate over the per-image analysis results of one batch. `failed`
+    counts unusable images; `skipped` counts images left unanalyzed because the server
+    was too busy, in which case the aggregate covers only part of the field.
+    """
+    disease_counts = {}
+    for analysis in analyses:
+        disease_counts[analysis["disease_name"]] = disease_counts.get(analysis["disease_name"], 0) + 1
+    severities = [analysis["severity"] for analysis in analyses]
+    healthy = sum(count for name, count in disease_counts.items() if name.endswith("healthy"))
+    return {
+        "images": len(analyses) + failed + skipped,
+        "analyzed": len(analyses),
+        "failed": failed,
+        "skipped": skipped,
+        "complete": skipped == 0,
+        "disease_counts": disease_counts,
+        "dominant_disease": max(disease_counts, key=disease_counts.get) if disease_counts else None,
+        "healthy_share": healthy / len(analyses) if analyses else 0.0,
+        "mean_severity_percentage": sum(severities) / len(severities) if severities else 0.0,
+        "max_severity_percentage": max(severities) if severities else 0.0,
+    }
@@ -6,15 +6,44 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
 import os
+import time
 
 # --- ADD THIS LINE ---
 from passlib.context import CryptContext
 # --- END OF ADDITION ---
 
-from app.database import SessionLocal # Remove pwd_context from here as it is defined below
-from app import schemas, database
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+from app import schemas, database, executor_service
+from app.cache_service import LRUCache
+
+# --- Password hashing configuration ---
+# New hashes use PASSWORD_HASH_SCHEME. Hashes made with another scheme, or with a
+# different PASSWORD_HASH_ROUNDS, still verify and are upgraded on the next login.
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "sha256_crypt")
+PASSWORD_HASH_ROUNDS = os.getenv("PASSWORD_HASH_ROUNDS")
+# Hashing jobs allowed to wait for the auth pool before new ones are turned away
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+_hash_settings = {}
+if PASSWORD_HASH_ROUNDS:
+    for setting in ("default_rounds", "min_rounds", "max_rounds"):
+        _hash_settings[f"{PASSWORD_HASH_SCHEME}__{setting}"] = int(PASSWORD_HASH_ROUNDS)
+
+pwd_context = CryptContext(
+    schemes=[PASSWORD_HASH_SCHEME] + [s for s in ("sha256_crypt", "bcrypt") if s != PASSWORD_HASH_SCHEME],
+    default=PASSWORD_HASH_SCHEME,
+    deprecated="auto",
+    **_hash_settings,
+)
+_pending_hash_jobs = 0
+
+# --- Login rate limiting ---
+# After LOGIN_MAX_FAILURES failed logins for one username within the window, further
+# attempts are refused with 429 before any hashing happens.
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", 5))
+LOGIN_FAILURE_WINDOW_SECONDS = float(os.getenv("LOGIN_FAILURE_WINDOW_SECONDS", 300))
 
 # Secret Key to create tokens (should be complex and stored securely)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key") # Add this to your .env file
@@ -23,11 +52,106 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# --- Authenticated-principal cache ---
+# Resolved users keyed by (token subject, token id, expiry), so protected endpoints
+# don't query the users table on every request. Entries for a user are dropped when
+# their password changes.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", 10000))
+_principal_cache = LRUCache(PRINCIPAL_CACHE_MAX_ENTRIES, ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS)
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    # Hashing always runs in the dedicated auth pool, so it is bounded even for sync callers
+    return executor_service.get_pool("auth").submit(pwd_context.verify, plain_password, hashed_password).result()
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return executor_service.get_pool("auth").submit(pwd_context.hash, password).result()
+
+async def _run_hash_job(func, *args):
+    global _pending_hash_jobs
+    if _pending_hash_jobs >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    _pending_hash_jobs += 1
+    try:
+        return await executor_service.run_in_pool("auth", func, *args)
+    finally:
+        _pending_hash_jobs -= 1
+
+async def verify_password_async(plain_password, hashed_password) -> tuple:
+    """
+    Verifies off the event loop. Returns (valid, new_hash); new_hash is set when the
+    stored hash uses outdated parameters and should be replaced.
+    """
+    return await _run_hash_job(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    return await _run_hash_job(pwd_context.hash, password)
+
+
+class LoginRateLimiter:
+    """
+    Counts failed logins per username in a sliding window. Attempts still being
+    verified count as failures until they finish, so a parallel burst of guesses
+    cannot get past the limit before the first of them fails.
+    """
+
+    def __init__(self, max_failures: int, window_seconds: float, max_tracked: int = 100000):
+        self.max_failures = max_failures
+        self.window_seconds = window_seconds
+        # username -> list of failure times; entries expire with the window
+        self._failures = LRUCache(max_tracked, ttl_seconds=window_seconds)
+        # username -> attempts reserved but not yet settled
+        self._pending = {}
+
+    def _recent(self, username: str) -> list:
+        cutoff = time.monotonic() - self.window_seconds
+        return [t for t in self._failures.peek(username, []) if t > cutoff]
+
+    def retry_after(self, username: str) -> int:
+        """Seconds until this username may try again, or 0 if it is not blocked."""
+        failures = self._recent(username)
+        if len(failures) >= self.max_failures:
+            return max(1, int(failures[0] + self.window_seconds - time.monotonic()) + 1)
+        if len(failures) + self._pending.get(username, 0) >= self.max_failures:
+            return 1  # Blocked by attempts still in progress; they settle within moments
+        return 0
+
+    def reserve(self, username: str) -> int:
+        """
+        Reserves an attempt before the password is checked. Returns 0 when reserved;
+        otherwise the Retry-After seconds, and nothing is reserved. Every reservation
+        must be settled with record_failure(), reset() or release().
+        """
+        retry_after = self.retry_after(username)
+        if not retry_after:
+            self._pending[username] = self._pending.get(username, 0) + 1
+        return retry_after
+
+    def release(self, username: str):
+        """Settles a reservation without counting it as a failure."""
+        remaining = self._pending.get(username, 0) - 1
+        if remaining > 0:
+            self._pending[username] = remaining
+        else:
+            self._pending.pop(username, None)
+
+    def record_failure(self, username: str):
+        self.release(username)
+        failures = self._recent(username)
+        failures.append(time.monotonic())
+        self._failures.put(username, failures[-self.max_failures:])
+
+    def reset(self, username: str):
+        """Settles a successful attempt and forgets earlier failures."""
+        self.release(username)
+        self._failures.pop(username)
+
+
+login_limiter = LoginRateLimiter(LOGIN_MAX_FAILURES, LOGIN_FAILURE_WINDOW_SECONDS)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -42,21 +166,54 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 def get_user(db, username: str):
     return db.query(database.User).filter(database.User.username == username).first()
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: SessionLocal = Depends(database.get_db)):
-    credentials_exception = HTTPException(
+async def get_user_async(db: AsyncSession, username: str):
+    result = await db.execute(select(database.User).where(database.User.username == username).limit(1))
+    return result.scalars().first()
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
+            raise _credentials_exception()
+        schemas.TokenData(username=username)
     except JWTError:
-        raise credentials_exception
-    user = get_user(db, username=token_data.username)
+        raise _credentials_exception()
+    return payload
+
+async def get_user_from_token_async(token: str, db: AsyncSession):
+    """Returns the database User for a token, bypassing the principal cache (for updates)."""
+    payload = _decode_token(token)
+    user = await get_user_async(db, username=payload["sub"])
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    payload = _decode_token(token)
+    key = (payload["sub"], payload.get("jti"), payload.get("exp"))
+    user = _principal_cache.get(key)
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        db_user = await get_user_async(db, username=payload["sub"])
+        if db_user is None:
+            raise _credentials_exception()
+        # Cache a detached snapshot rather than the ORM object bound to this request's session
+        user = schemas.User(id=db_user.id, username=db_user.username, email=db_user.email, name=db_user.name)
+        _principal_cache.put(key, user)
+    return user
+
+def invalidate_user(username: str):
+    """Drops every cached principal of this user, e.g. after a password reset."""
+    for key in _principal_cache.keys():
+        if key[0] == username:
+            _principal_cache.pop(key)
+
+def principal_cache_stats() -> dict:
+    return _principal_cache.stats()
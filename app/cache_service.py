@@ -0,0 +1,216 @@
+# app/cache_service.py
+import os
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+# --- Analysis cache configuration ---
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", 4096))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", 3600))
+# Maximum Hamming distance between two 64-bit perceptual hashes for the images to
+# count as near-duplicates (e.g. burst shots of the same leaf). Negative disables it.
+ANALYSIS_CACHE_PHASH_DISTANCE = int(os.getenv("ANALYSIS_CACHE_PHASH_DISTANCE", 4))
+
+
+def _estimate_size(value) -> int:
+    """Rough in-memory size of a cached value, used to enforce the byte budget."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with per-entry TTL, an entry limit and a memory budget.
+    Keeps hit/miss/eviction counters for monitoring.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int = 0, ttl_seconds: float = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes  # 0 means no byte budget
+        self.ttl_seconds = ttl_seconds  # 0 means entries never expire
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at and expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Like get, but does not touch the counters or the LRU order."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] and entry[1] < time.monotonic()):
+                return default
+            return entry[0]
+
+    def touch(self, key, default=None):
+        """Like get (the entry becomes most recently used), but leaves the hit/miss counters alone."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] and entry[1] < time.monotonic()):
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = _estimate_size(value)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def content_key(image_bytes: bytes) -> str:
+    """Exact content hash of an upload."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(tensor: np.ndarray) -> int:
+    """
+    64-bit difference hash (dHash) of a preprocessed (224, 224, 3) image tensor.
+    Re-encoded or slightly shifted copies of the same photo land within a few bits.
+    """
+    gray = tensor @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class AnalysisCache:
+    """
+    Caches /analyze-plant/ results by exact content hash, with an optional
+    perceptual-hash index for near-duplicate uploads.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float, phash_distance: int):
+        self.results = LRUCache(max_entries, max_bytes, ttl_seconds)
+        self.phash_distance = phash_distance
+        self._phashes = {}  # content key -> perceptual hash
+        self._lock = threading.Lock()
+        self.near_hits = 0
+
+    @property
+    def near_duplicates_enabled(self) -> bool:
+        return self.phash_distance >= 0
+
+    def get(self, key: str):
+        return self.results.get(key)
+
+    def get_similar(self, phash: int):
+        """Returns the result of the closest cached near-duplicate image, if there is one."""
+        with self._lock:
+            candidates = list(self._phashes.items())
+        matches = []
+        for key, other in candidates:
+            distance = (phash ^ other).bit_count()
+            if distance <= self.phash_distance:
+                matches.append((distance, key))
+        # The closest match may have been evicted or expired; fall back to the next one
+        dead = []
+        value = None
+        for _, key in sorted(matches):
+            # A near hit is a use like an exact hit, so the entry stays warm in the LRU order
+            value = self.results.touch(key)
+            if value is not None:
+                break
+            dead.append(key)
+        if dead:
+            # Evicted or expired entries are pruned lazily here
+            with self._lock:
+                for key in dead:
+                    self._phashes.pop(key, None)
+        if value is None:
+            return None
+        self.near_hits += 1
+        return value
+
+    def put(self, key: str, value: dict, phash: int = None):
+        self.results.put(key, value)
+        if phash is not None and self.near_duplicates_enabled:
+            with self._lock:
+                self._phashes[key] = phash
+                if len(self._phashes) > 2 * self.results.max_entries:
+                    live = set(self.results.keys())
+                    self._phashes = {k: v for k, v in self._phashes.items() if k in live}
+
+    def stats(self) -> dict:
+        stats = self.results.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["near_duplicate_hits"] = self.near_hits
+        # Exact misses that were answered by a near-duplicate still avoided the model
+        stats["hit_ratio"] = (stats["hits"] + self.near_hits) / lookups if lookups else 0.0
+        return stats
+
+
+analysis_cache = AnalysisCache(
+    ANALYSIS_CACHE_MAX_ENTRIES,
+    ANALYSIS_CACHE_MAX_BYTES,
+    ANALYSIS_CACHE_TTL_SECONDS,
+    ANALYSIS_CACHE_PHASH_DISTANCE,
+)
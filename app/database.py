@@ -1,9 +1,11 @@
 # plant_disease_backend/app/database.py
 
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Date, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import datetime
 from dotenv import load_dotenv
 
@@ -21,19 +23,107 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 if not SQLALCHEMY_DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not found. Please set it in your .env file.")
 
-# Create the SQLAlchemy engine for PostgreSQL
-# The 'connect_args' is for SQLite only, so we remove it.
+# --- Engine and pool configuration ---
+# Connections kept open per process, extra connections allowed under bursts, seconds
+# to wait for a free connection, and seconds before a connection is recycled.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 300))
+# TLS mode for PostgreSQL connections ("require", "verify-full", "disable", ...)
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+
+# SQLAlchemy no longer accepts the "postgres://" scheme some hosts hand out
+if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
+    SQLALCHEMY_DATABASE_URL = "postgresql://" + SQLALCHEMY_DATABASE_URL[len("postgres://"):]
+
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+is_sqlite = _url.get_backend_name() == "sqlite"
+is_postgres = _url.get_backend_name() == "postgresql"
+
+
+def _pool_args() -> dict:
+    # SQLite files need no connection pool tuning (and in-memory SQLite has no QueuePool)
+    if is_sqlite:
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+if is_postgres and "sslmode" not in _url.query:
+    connect_args = {"sslmode": DB_SSLMODE}
+elif is_sqlite:
+    # Sessions are used from the thread pool, not only the thread that opened them
+    connect_args = {"check_same_thread": False}
+else:
+    connect_args = {}
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     pool_pre_ping=True,
-    pool_recycle=300,
-    connect_args={"sslmode": "require"}
+    connect_args=connect_args,
+    **_pool_args()
 )
 
+# --- Async engine ---
+# Used by the hot endpoints so their queries don't block the event loop. It is created
+# on first use, so the async driver (asyncpg, or aiosqlite for SQLite) is only needed
+# when those endpoints are actually called.
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+_async_engine = None
+_async_session_factory = None
+
+
+def async_database_url():
+    """DATABASE_URL rewritten for the async driver of the same database."""
+    backend = _url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    # asyncpg takes the TLS mode as the 'ssl' connect argument instead of a URL parameter
+    return _url.set(drivername=ASYNC_DRIVERS[backend]).difference_update_query(["sslmode"])
+
+
+def get_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        async_connect_args = {}
+        if is_postgres:
+            async_connect_args["ssl"] = _url.query.get("sslmode", DB_SSLMODE)
+        _async_engine = create_async_engine(
+            async_database_url(),
+            pool_pre_ping=True,
+            connect_args=async_connect_args,
+            **_pool_args()
+        )
+        _async_session_factory = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_engine
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
 # --- The rest of the file is the same ---
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def naive_utc(value):
+    """
+    Timestamps are stored as naive UTC. Converts a timezone-aware datetime (e.g. from a
+    client or a query string) to that form; naive values are assumed to be UTC already.
+    """
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
 class User(Base):
     __tablename__ = "users"
 
@@ -46,19 +136,25 @@ class User(Base):
 # Your database model remains unchanged
 class DiagnosisLog(Base):
     __tablename__ = "diagnosis_logs"
+    __table_args__ = (
+        # Backs the bounding-box filter of the hotspot map
+        Index("ix_diagnosis_logs_lat_lon", "latitude", "longitude"),
+        # Serves each page of /history/me/ straight from the index
+        Index("ix_diagnosis_logs_owner_timestamp", "owner_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     disease_name = Column(String, index=True)
     severity = Column(Float)
     latitude = Column(Float)
     longitude = Column(Float)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)  
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     owner_id = Column(Integer, ForeignKey("users.id")) # <-- ADD THIS LINE
 
 # plant_disease_backend/app/database.py
 
 # 1. UPDATE THIS LINE at the top to include 'Text'
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text, UniqueConstraint
 
 # ... (keep all your existing code, engine, User, DiagnosisLog, etc.) ...
 
@@ -73,8 +169,65 @@ class Feedback(Base):
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
     
+# Client-side ids of diagnoses synced from the mobile app, so retried syncs are idempotent
+class DiagnosisSyncKey(Base):
+    __tablename__ = "diagnosis_sync_keys"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    client_id = Column(String, primary_key=True)
+    log_id = Column(Integer, ForeignKey("diagnosis_logs.id"), nullable=False)
+
+
+# Daily diagnosis counts per grid cell and disease, maintained by app.rollup_service
+class DiagnosisRollup(Base):
+    __tablename__ = "diagnosis_rollups"
+
+    # Day first, so trend queries over a date range scan the primary key in order
+    day = Column(Date, primary_key=True)
+    disease_name = Column(String, primary_key=True)
+    cell_lat = Column(Integer, primary_key=True)
+    cell_lon = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    severity_sum = Column(Float, nullable=False, default=0.0)
+
+
+# Generated treatment plans, one per (disease, severity bucket, language, generator)
+class TreatmentPlan(Base):
+    __tablename__ = "treatment_plans"
+    __table_args__ = (
+        UniqueConstraint("disease_name", "severity_bucket", "language", "generator", name="uq_treatment_plan_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    disease_name = Column(String, nullable=False)
+    severity_bucket = Column(String, nullable=False)
+    language = Column(String, nullable=False)
+    generator = Column(String, nullable=False)
+    plan = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+# One-time passwords for password resets, shared by all workers (see app.otp_service)
+class OTPToken(Base):
+    __tablename__ = "otp_tokens"
+
+    key = Column(String, primary_key=True)  # The email address the OTP was sent for
+    code_hash = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+
+
+# Set once create_db_and_tables() has run; reported by the readiness endpoint
+tables_ready = False
+
 def create_db_and_tables():
+    global tables_ready
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add indexes introduced later separately
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    tables_ready = True
 
 def get_db():
     db = SessionLocal()
@@ -83,4 +236,11 @@ def get_db():
     finally:
         db.close()
 
-otp_store={}
\ No newline at end of file
+def async_session():
+    """A new AsyncSession, for work that outlives the request handler (e.g. streamed responses)."""
+    get_async_engine()
+    return _async_session_factory()
+
+async def get_async_db():
+    async with async_session() as db:
+        yield db
@@ -1,63 +1,182 @@
 # plant_disease_backend/app/economic_service.py
 
-# Data contains:
+# Crop economics are loaded from data/crop_economics.json:
 # - 'yield_per_acre_kg': Average yield in kilograms per acre.
 # - 'market_price_per_kg': Average market price in INR per kilogram.
 # - 'max_loss_factor': The maximum potential yield loss from this disease (as a decimal).
+# Every model class maps to a crop, and regions can override a crop's yield and price.
+# The file is re-read automatically when it changes on disk.
+
+import os
+import json
+import time
+import threading
+from typing import Optional
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ECONOMICS_DATA_PATH = os.getenv(
+    "ECONOMICS_DATA_PATH", os.path.join(BASE_DIR, "..", "data", "crop_economics.json")
+)
+# How often (at most) the data file's modification time is checked
+ECONOMICS_RELOAD_INTERVAL_SECONDS = float(os.getenv("ECONOMICS_RELOAD_INTERVAL_SECONDS", 5))
+
+# Region used when none (or an unknown one) is requested
+NATIONAL_REGION = "national"
+# Cap on remembered non-exact disease name lookups
+_MAX_FUZZY_LOOKUPS = 4096
+
+
+def normalize_region(region: Optional[str]) -> str:
+    if not region:
+        return NATIONAL_REGION
+    return region.strip().lower().replace(" ", "_").replace("-", "_")
+
+
+class EconomicsIndex:
+    """
+    Precomputed lookup tables built from the data file. Disease keys map to a column
+    index; regions map to a row index of the yield/price matrices. The last column
+    holds the 'default' entry for unknown diseases.
+    """
+
+    def __init__(self, data: dict):
+        default = data["default"]
+        crops = data["crops"]
+        self.keys = list(data["diseases"]) + ["default"]
+        self.column = {key: i for i, key in enumerate(self.keys)}
+        self.default_column = len(self.keys) - 1
+        self._lower_column = {key.lower(): i for key, i in self.column.items()}
+        # Longest first, so "Tomato___Early_blight" is not matched by a shorter key
+        self._by_length = sorted(self._lower_column.items(), key=lambda kv: len(kv[0]), reverse=True)
+        self._fuzzy = {}
+
+        self.crop_names = [data["diseases"][key]["crop"] for key in self.keys[:-1]] + [default["crop_name"]]
+        self.loss_factors = np.array(
+            [data["diseases"][key]["max_loss_factor"] for key in self.keys[:-1]] + [default["max_loss_factor"]],
+            dtype=np.float64,
+        )
+
+        self.regions = [NATIONAL_REGION] + sorted(normalize_region(r) for r in data.get("regions", {}))
+        self.row = {region: i for i, region in enumerate(self.regions)}
+        region_data = {normalize_region(r): v for r, v in data.get("regions", {}).items()}
+
+        self.yields = np.empty((len(self.regions), len(self.keys)), dtype=np.float64)
+        self.prices = np.empty_like(self.yields)
+        for r, region in enumerate(self.regions):
+            overrides = region_data.get(region, {})
+            for c, crop in enumerate(self.crop_names):
+                values = dict(crops.get(crop, default))
+                values.update(overrides.get(crop, {}))
+                self.yields[r, c] = values["yield_per_acre_kg"]
+                self.prices[r, c] = values["market_price_per_kg"]
+
+    def disease_column(self, disease_name: str) -> int:
+        """Column for a disease name: exact class name first, then case-insensitive, then substring."""
+        column = self.column.get(disease_name)
+        if column is not None:
+            return column
+        lowered = disease_name.lower()
+        column = self._lower_column.get(lowered)
+        if column is not None:
+            return column
+        column = self._fuzzy.get(lowered)
+        if column is None:
+            # Names with prefixes or suffixes, e.g. "Detected: Tomato___Late_blight"
+            column = self.default_column
+            for key, candidate in self._by_length:
+                if candidate != self.default_column and key in lowered:
+                    column = candidate
+                    break
+            if len(self._fuzzy) >= _MAX_FUZZY_LOOKUPS:
+                self._fuzzy.clear()
+            self._fuzzy[lowered] = column
+        return column
+
+    def region_row(self, region: Optional[str]) -> int:
+        return self.row.get(normalize_region(region), 0)
+
+
+_index = None
+_index_mtime = None
+_last_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def _load_index() -> EconomicsIndex:
+    with open(ECONOMICS_DATA_PATH, "r") as f:
+        return EconomicsIndex(json.load(f))
+
+
+def reload() -> EconomicsIndex:
+    """Re-reads the data file and swaps the index in atomically."""
+    global _index, _index_mtime, _last_check
+    with _reload_lock:
+        mtime = os.path.getmtime(ECONOMICS_DATA_PATH)
+        _index = _load_index()
+        _index_mtime = mtime
+        _last_check = time.monotonic()
+    return _index
+
+
+def get_index() -> EconomicsIndex:
+    """Returns the current index, reloading it if the data file changed on disk."""
+    global _last_check
+    if _index is None:
+        return reload()
+    now = time.monotonic()
+    if now - _last_check >= ECONOMICS_RELOAD_INTERVAL_SECONDS:
+        _last_check = now
+        try:
+            if os.path.getmtime(ECONOMICS_DATA_PATH) != _index_mtime:
+                return reload()
+        except (OSError, ValueError, KeyError) as e:
+            # Keep serving the last good tables if the file is missing or half-written
+            print(f"Could not reload crop economics data. Error: {e}")
+    return _index
 
-CROP_DATA = {
-    "Apple___Apple_scab": {
-        "yield_per_acre_kg": 8000,  # Approx. 8-10 tonnes
-        "market_price_per_kg": 135,
-        "max_loss_factor": 0.70, # Can be up to 70%
-        "crop_name": "Apple"
-    },
-    "Tomato___Late_blight": {
-        "yield_per_acre_kg": 20000, # Approx. 20 tonnes/ha
-        "market_price_per_kg": 18,
-        "max_loss_factor": 0.80, # Can be up to 80-100%
-        "crop_name": "Tomato"
-    },
-    "Potato___Late_blight": {
-        "yield_per_acre_kg": 12000, # Approx. 12 tonnes/ha for AP
-        "market_price_per_kg": 15,
-        "max_loss_factor": 0.75,
-        "crop_name": "Potato"
-    },
-    # Add a default for diseases not in this specific list
-    "default": {
-        "yield_per_acre_kg": 15000,
-        "market_price_per_kg": 20,
-        "max_loss_factor": 0.30, # A conservative default
-        "crop_name": "General Crop"
-    }
-}
 
 def get_disease_key(disease_name: str) -> str:
-    """Finds the matching key in CROP_DATA, even with prefixes."""
-    for key in CROP_DATA.keys():
-        if key.lower() in disease_name.lower():
-            return key
-    return "default"
+    """Finds the matching disease key in the economics data, even with prefixes."""
+    index = get_index()
+    return index.keys[index.disease_column(disease_name)]
 
-def calculate_economic_impact(disease_name: str, severity: float) -> dict:
+
+def calculate_economic_impact(disease_name: str, severity: float, region: Optional[str] = None) -> dict:
     """
     Calculates the estimated financial loss based on disease and severity.
     """
-    disease_key = get_disease_key(disease_name)
-    data = CROP_DATA[disease_key]
+    return calculate_economic_impact_batch([(disease_name, severity, region)])[0]
+
+
+def calculate_economic_impact_batch(items, acres=None) -> list:
+    """
+    Vectorized calculate_economic_impact over (disease_name, severity, region) tuples.
+    `acres` optionally scales each item's loss by its cultivated area.
+    """
+    index = get_index()
+    columns = np.fromiter((index.disease_column(name) for name, _, _ in items), dtype=np.intp, count=len(items))
+    rows = np.fromiter((index.region_row(region) for _, _, region in items), dtype=np.intp, count=len(items))
+    severity_decimal = np.fromiter((severity for _, severity, _ in items), dtype=np.float64, count=len(items)) / 100
 
     # Simple linear model: financial_loss = (total_value_per_acre) * (max_loss_factor) * (severity_as_decimal)
-    total_value = data['yield_per_acre_kg'] * data['market_price_per_kg']
-    
-    # We use the severity as a direct indicator of potential loss percentage
-    severity_decimal = severity / 100
-    
-    potential_loss = total_value * data['max_loss_factor'] * severity_decimal
-
-    return {
-        "crop_name": data['crop_name'],
-        "potential_financial_loss_min": int(potential_loss * 0.75), # Provide a range
-        "potential_financial_loss_max": int(potential_loss),
-        "yield_loss_percentage": int(data['max_loss_factor'] * severity_decimal * 100)
-    }
\ No newline at end of file
+    total_value = index.yields[rows, columns] * index.prices[rows, columns]
+    yield_loss = index.loss_factors[columns] * severity_decimal
+    potential_loss = total_value * yield_loss
+    if acres is not None:
+        potential_loss = potential_loss * np.asarray(acres, dtype=np.float64)
+
+    loss_min = (potential_loss * 0.75).astype(np.int64)  # Provide a range
+    loss_max = potential_loss.astype(np.int64)
+    yield_loss_pct = (yield_loss * 100).astype(np.int64)
+
+    return [
+        {
+            "crop_name": index.crop_names[column],
+            "region": index.regions[row],
+            "potential_financial_loss_min": int(lo),
+            "potential_financial_loss_max": int(hi),
+            "yield_loss_percentage": int(pct),
+        }
+        for column, row, lo, hi, pct in zip(columns.tolist(), rows.tolist(), loss_min, loss_max, yield_loss_pct)
+    ]
@@ -0,0 +1,67 @@
+# app/executor_service.py
+import os
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# --- Executor configuration ---
+# CPU-heavy stages (image decoding, TensorFlow inference, OpenCV severity analysis) run in these
+# pools so the event loop stays free for cheap endpoints like /token.
+# The inference pool should be at least PREDICT_MAX_BATCH_SIZE so enough callers
+# can wait on the batching engine at once to fill a batch.
+POOL_CONFIG = {
+    "preprocess": {
+        "size": int(os.getenv("PREPROCESS_POOL_SIZE", os.cpu_count() or 2)),
+        "kind": "thread",  # Returns decoded arrays, which must not be pickled back across processes
+    },
+    "inference": {
+        "size": int(os.getenv("INFERENCE_POOL_SIZE", 16)),
+        "kind": "thread",  # The model lives in this process, so inference always uses threads
+    },
+    "auth": {
+        # Password hashing is deliberately slow; a small pool caps how much CPU a login burst can take
+        "size": int(os.getenv("PASSWORD_HASH_POOL_SIZE", 2)),
+        "kind": "thread",
+    },
+    "severity": {
+        "size": int(os.getenv("SEVERITY_POOL_SIZE", os.cpu_count() or 2)),
+        "kind": os.getenv("SEVERITY_POOL_KIND", "thread"),  # "thread" or "process"
+    },
+}
+
+_pools = {}
+
+
+def get_pool(name: str):
+    """Returns the named executor, creating it on first use."""
+    pool = _pools.get(name)
+    if pool is None:
+        config = POOL_CONFIG[name]
+        size = max(1, config["size"])
+        if config["kind"] == "process":
+            pool = ProcessPoolExecutor(max_workers=size)
+        else:
+            pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{name}-pool")
+        _pools[name] = pool
+    return pool
+
+
+async def run_in_pool(name: str, func, *args, **kwargs):
+    """Runs func(*args, **kwargs) in the named pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    pool = get_pool(name)
+    if isinstance(pool, ThreadPoolExecutor):
+        # Carry request-scoped context variables over to the worker thread
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+    else:
+        call = functools.partial(func, *args, **kwargs)
+    return await loop.run_in_executor(pool, call)
+
+
+def shutdown(wait: bool = True):
+    """Shuts down every pool that has been started. Called on application shutdown."""
+    while _pools:
+        _, pool = _pools.popitem()
+        pool.shutdown(wait=wait, cancel_futures=True)
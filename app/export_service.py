@@ -0,0 +1,134 @@
+# app/export_service.py
+"""
+Streaming exports of feedback and diagnosis logs, for admin exports and research
+data pulls. Rows are read from a server-side cursor EXPORT_BATCH_SIZE at a time and
+written out as NDJSON or CSV as they arrive, so memory use stays flat and the first
+bytes go out at once, however many rows match.
+
+Rows come in ascending id order. To fetch the next page (or resume an interrupted
+export), pass the id of the last row received as `after_id`.
+"""
+import os
+import io
+import csv
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app import database
+
+# Rows fetched from the database cursor (and written to the response) per round trip
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+# Users allowed to export feedback and every user's diagnosis logs (comma-separated usernames)
+EXPORT_ADMIN_USERNAMES = {u.strip() for u in os.getenv("EXPORT_ADMIN_USERNAMES", "").split(",") if u.strip()}
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Leading characters that make spreadsheets treat a CSV cell as a formula
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+FEEDBACK_COLUMNS = ("id", "name", "email", "message", "timestamp")
+DIAGNOSIS_LOG_COLUMNS = ("id", "disease_name", "severity", "latitude", "longitude", "timestamp", "owner_id")
+
+
+def is_admin(user) -> bool:
+    return user.username in EXPORT_ADMIN_USERNAMES
+
+
+def require_admin(user):
+    if not is_admin(user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to export this data")
+
+
+def _page(query, id_column, after_id: Optional[int], limit: Optional[int]):
+    # Keyset pagination on the primary key: no OFFSET scans, and stable under inserts
+    if after_id is not None:
+        query = query.where(id_column > after_id)
+    query = query.order_by(id_column)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def feedbacks_query(
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    email: Optional[str] = None,
+):
+    Feedback = database.Feedback
+    # Plain column tuples, not ORM objects: nothing accumulates in the session's identity map
+    query = select(*(getattr(Feedback, c) for c in FEEDBACK_COLUMNS))
+    if start:
+        query = query.where(Feedback.timestamp >= database.naive_utc(start))
+    if end:
+        query = query.where(Feedback.timestamp < database.naive_utc(end))
+    if email:
+        query = query.where(Feedback.email == email)
+    return _page(query, Feedback.id, after_id, limit)
+
+
+def diagnosis_logs_query(
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    disease_name: Optional[str] = None,
+    owner_id: Optional[int] = None,
+):
+    Log = database.DiagnosisLog
+    query = select(*(getattr(Log, c) for c in DIAGNOSIS_LOG_COLUMNS))
+    if start:
+        query = query.where(Log.timestamp >= database.naive_utc(start))
+    if end:
+        query = query.where(Log.timestamp < database.naive_utc(end))
+    if disease_name:
+        query = query.where(Log.disease_name == disease_name)
+    if owner_id is not None:
+        query = query.where(Log.owner_id == owner_id)
+    return _page(query, Log.id, after_id, limit)
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode_ndjson(columns: tuple, rows) -> str:
+    return "".join(json.dumps(dict(zip(columns, map(_plain, row)))) + "\n" for row in rows)
+
+
+def _csv_cell(value):
+    value = _plain(value)
+    # Free text (e.g. feedback from the unauthenticated form) must not run as a formula
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _encode_csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_csv_cell(v) for v in row] for row in rows)
+    return buffer.getvalue()
+
+
+async def stream_rows(query, columns: tuple, fmt: str):
+    """Encoded chunks of the query's rows, one per batch fetched from the cursor."""
+    if fmt == "csv":
+        yield _encode_csv([columns])
+    # A session of its own: the request's session is closed once the handler returns
+    async with database.async_session() as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield _encode_csv(rows) if fmt == "csv" else _encode_ndjson(columns, rows)
+
+
+def streaming_response(query, columns: tuple, fmt: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_rows(query, columns, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
@@ -0,0 +1,42 @@
+# app/health_service.py
+import os
+import asyncio
+
+from app import database, prediction_service, treatment_service
+
+# Load and warm up the model in the background at startup instead of on the first request
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "1") == "1"
+
+# Errors from background initialization, by component, so readiness can report them
+init_errors = {}
+
+
+async def _init_component(name: str, func):
+    try:
+        await asyncio.to_thread(func)
+    except Exception as e:
+        init_errors[name] = str(e)
+        print(f"Startup initialization of {name} failed. Error: {e}")
+
+
+async def initialize():
+    """Runs the heavy startup work (tables, model load and warmup) off the event loop."""
+    tasks = [_init_component("database", database.create_db_and_tables)]
+    if PRELOAD_MODEL:
+        tasks.append(_init_component("model", prediction_service.warmup))
+    await asyncio.gather(*tasks)
+
+
+def component_status() -> dict:
+    return {
+        "database": database.tables_ready,
+        "model_loaded": prediction_service.is_loaded(),
+        "model_warm": prediction_service.is_warm(),
+        # The LLM is optional: treatment plans fall back to a placeholder without it
+        "treatment_llm": treatment_service.is_loaded(),
+    }
+
+
+def is_ready() -> bool:
+    status = component_status()
+    return status["database"] and (status["model_warm"] or not PRELOAD_MODEL)
@@ -0,0 +1,155 @@
+# app/hotspot_service.py
+import os
+from typing import Optional
+from datetime import datetime
+from sqlalchemy import func, cast, Integer
+
+from app import database, rollup_service
+
+# Grid cells per map tile width. A tile at zoom z spans 360 / 2**z degrees of longitude.
+CELLS_PER_TILE = 8
+MAX_ZOOM = 20
+# Upper bound on the number of cells returned by one query (the busiest ones are kept)
+MAX_CELLS = 20000
+# Upper bound on the rows returned by /get-hotspots/?raw=true (the newest are kept)
+MAX_RAW_ROWS = int(os.getenv("HOTSPOT_MAX_RAW_ROWS", 1000))
+
+
+def cell_size_for_zoom(zoom: int) -> float:
+    """Grid cell size in degrees for a web-map zoom level."""
+    zoom = min(max(zoom, 0), MAX_ZOOM)
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def _cell_index(column, offset: float, cell_size: float, dialect: str):
+    # Coordinates are shifted to be non-negative first, so on SQLite (which may lack
+    # FLOOR) truncating with CAST gives the same result as flooring.
+    scaled = (column + offset) / cell_size
+    if dialect == "sqlite":
+        return cast(scaled, Integer)
+    return cast(func.floor(scaled), Integer)
+
+
+def aggregate_hotspots(
+    db,
+    since: datetime,
+    cell_size: float,
+    bbox: Optional[tuple] = None,
+    disease_name: Optional[str] = None,
+) -> list:
+    """
+    Groups diagnosis logs since `since` into grid cells of `cell_size` degrees.
+    bbox is (min_lat, min_lon, max_lat, max_lon). Returns one dict per non-empty cell
+    with its center, count, mean severity and per-disease counts, busiest cells first.
+    """
+    Log = database.DiagnosisLog
+    dialect = db.get_bind().dialect.name
+    lat_idx = _cell_index(Log.latitude, 90.0, cell_size, dialect).label("lat_idx")
+    lon_idx = _cell_index(Log.longitude, 180.0, cell_size, dialect).label("lon_idx")
+
+    query = db.query(
+        lat_idx,
+        lon_idx,
+        Log.disease_name,
+        func.count(Log.id),
+        func.sum(Log.severity),
+    ).filter(
+        Log.timestamp >= since,
+        Log.latitude.isnot(None),
+        Log.longitude.isnot(None),
+    )
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        query = query.filter(Log.latitude.between(min_lat, max_lat), Log.longitude.between(min_lon, max_lon))
+    if disease_name:
+        query = query.filter(Log.disease_name == disease_name)
+    rows = query.group_by(lat_idx, lon_idx, Log.disease_name).all()
+    return _build_cells(rows, cell_size)
+
+
+def aggregate_rollup_hotspots(
+    db,
+    since: datetime,
+    cell_size: float,
+    bbox: Optional[tuple] = None,
+    disease_name: Optional[str] = None,
+) -> list:
+    """
+    aggregate_hotspots read from diagnosis_rollups instead of the raw logs. Each rollup
+    cell goes to the map cell holding its center, so cell edges and the bbox are exact
+    to ROLLUP_CELL_DEG, and whole days are counted from the day of `since`.
+    """
+    Rollup = database.DiagnosisRollup
+    step = rollup_service.ROLLUP_CELL_DEG
+    dialect = db.get_bind().dialect.name
+    lat_idx = _cell_index((Rollup.cell_lat + 0.5) * step, 0.0, cell_size, dialect).label("lat_idx")
+    lon_idx = _cell_index((Rollup.cell_lon + 0.5) * step, 0.0, cell_size, dialect).label("lon_idx")
+
+    query = db.query(
+        lat_idx,
+        lon_idx,
+        Rollup.disease_name,
+        func.sum(Rollup.count),
+        func.sum(Rollup.severity_sum),
+    ).filter(
+        Rollup.day >= since.date(),
+        Rollup.cell_lat != rollup_service.NO_LOCATION_CELL,
+    )
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        min_cell = rollup_service.cell_for(min_lat, min_lon)
+        max_cell = rollup_service.cell_for(max_lat, max_lon)
+        query = query.filter(
+            Rollup.cell_lat.between(min_cell[0], max_cell[0]),
+            Rollup.cell_lon.between(min_cell[1], max_cell[1]),
+        )
+    if disease_name:
+        query = query.filter(Rollup.disease_name == disease_name)
+    rows = query.group_by(lat_idx, lon_idx, Rollup.disease_name).all()
+    return _build_cells(rows, cell_size)
+
+
+def hotspot_cells(
+    db,
+    since: datetime,
+    cell_size: float,
+    bbox: Optional[tuple] = None,
+    disease_name: Optional[str] = None,
+) -> list:
+    """
+    Hotspot cells for a map view. Cells at least as large as the rollup grid are built
+    from the rollups, whose size doesn't grow with the log volume; only the finer
+    zoom levels scan the raw logs.
+    """
+    if cell_size >= rollup_service.ROLLUP_CELL_DEG:
+        return aggregate_rollup_hotspots(db, since, cell_size, bbox=bbox, disease_name=disease_name)
+    return aggregate_hotspots(db, since, cell_size, bbox=bbox, disease_name=disease_name)
+
+
+def _build_cells(rows, cell_size: float) -> list:
+    # rows are (lat index, lon index, disease, count, severity sum) per cell and disease
+    cells = {}
+    for lat_i, lon_i, disease, count, severity_sum in rows:
+        cell = cells.get((lat_i, lon_i))
+        if cell is None:
+            cell = cells[(lat_i, lon_i)] = {
+                "latitude": (lat_i + 0.5) * cell_size - 90.0,
+                "longitude": (lon_i + 0.5) * cell_size - 180.0,
+                "cell_size": cell_size,
+                "count": 0,
+                "severity_sum": 0.0,
+                "disease_counts": {},
+            }
+        cell["count"] += count
+        cell["severity_sum"] += severity_sum or 0.0
+        cell["disease_counts"][disease] = count
+
+    result = []
+    for cell in cells.values():
+        severity_sum = cell.pop("severity_sum")
+        cell["mean_severity"] = severity_sum / cell["count"]
+        cell["top_disease"] = max(cell["disease_counts"], key=cell["disease_counts"].get)
+        result.append(cell)
+    result.sort(key=lambda c: c["count"], reverse=True)
+    return result[:MAX_CELLS]
+
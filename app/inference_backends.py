@@ -0,0 +1,168 @@
+# app/inference_backends.py
+import os
+import threading
+import numpy as np
+
+from app import metrics_service
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, "..", "models")
+
+KERAS_MODEL_PATH = os.path.join(MODELS_DIR, "plant_disease_model.h5")
+TFLITE_MODEL_PATHS = {
+    "tflite-fp16": os.path.join(MODELS_DIR, "plant_disease_model_fp16.tflite"),
+    "tflite-int8": os.path.join(MODELS_DIR, "plant_disease_model_int8.tflite"),
+}
+
+# Threads used by each TFLite interpreter (0 lets TFLite decide)
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", 0))
+
+# --- Cascade configuration ---
+# Small first-stage model (.tflite or .h5), created with: python -m tools.cascade_tool distill
+CASCADE_STAGE1_MODEL_PATH = os.getenv(
+    "CASCADE_STAGE1_MODEL_PATH", os.path.join(MODELS_DIR, "plant_disease_model_stage1.tflite")
+)
+# Backend that answers the images the first stage is unsure about
+CASCADE_STAGE2_BACKEND = os.getenv("CASCADE_STAGE2_BACKEND", "keras")
+# First-stage confidence needed to skip the full model; tune it with: python -m tools.cascade_tool report
+CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", 0.9))
+
+
+class KerasBackend:
+    """Runs the original .h5 model in float32 through Keras."""
+
+    name = "keras"
+
+    def __init__(self, model_path: str = KERAS_MODEL_PATH):
+        import tensorflow as tf
+
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+def _load_tflite_interpreter(model_path: str, num_threads: int):
+    # Prefer the slim tflite-runtime wheel when it is installed, so TensorFlow
+    # itself never has to be imported on inference-only boxes.
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads or None)
+
+
+class TFLiteBackend:
+    """
+    Runs a converted .tflite model (float16 or int8 post-training quantized).
+    Quantized input/output tensors are (de)quantized here, so callers always pass
+    float32 images in [0, 1] and get float32 probabilities back.
+
+    Resizing an interpreter's input re-plans all of its tensors, which would happen on
+    nearly every call behind the micro-batcher. So the single interpreter only grows,
+    to the largest batch seen (warmup() takes it to PREDICT_MAX_BATCH_SIZE at startup),
+    and smaller batches are zero-padded to that size.
+    """
+
+    def __init__(self, name: str, model_path: str, num_threads: int = TFLITE_NUM_THREADS):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"{model_path} not found. Create it with: python -m tools.tflite_tool convert"
+            )
+        self.name = name
+        self.interpreter = _load_tflite_interpreter(model_path, num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        # An interpreter holds a single set of tensors, so calls must not overlap
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size: int):
+        shape = list(self._input["shape"])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self._input["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        n = batch.shape[0]
+        with self._lock:
+            if n > self._batch_size:
+                self._resize(n)
+            if n < self._batch_size:
+                padding = np.zeros((self._batch_size - n,) + batch.shape[1:], dtype=batch.dtype)
+                batch = np.concatenate([batch, padding])
+
+            input_dtype = self._input["dtype"]
+            if input_dtype in (np.int8, np.uint8):
+                scale, zero_point = self._input["quantization"]
+                batch = np.round(batch / scale + zero_point)
+                info = np.iinfo(input_dtype)
+                batch = np.clip(batch, info.min, info.max)
+            self.interpreter.set_tensor(self._input["index"], batch.astype(input_dtype, copy=False))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output["index"])
+
+            if self._output["dtype"] in (np.int8, np.uint8):
+                scale, zero_point = self._output["quantization"]
+                output = (output.astype(np.float32) - zero_point) * scale
+            return np.array(output[:n], dtype=np.float32)
+
+
+def load_model_file(name: str, model_path: str):
+    """A backend for a single model file, picked by its extension (.tflite or Keras)."""
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(
+            f"{model_path} not found. Create it with: python -m tools.cascade_tool distill"
+        )
+    if model_path.endswith(".tflite"):
+        return TFLiteBackend(name, model_path)
+    return KerasBackend(model_path)
+
+
+class CascadeBackend:
+    """
+    Two-stage cascade. A small, fast model classifies every image; rows whose top
+    probability reaches the threshold are answered by it, and only the rest are run
+    through the full model. Both models share the class_indices.json classes.
+    """
+
+    name = "cascade"
+
+    def __init__(self, stage1, stage2, threshold: float = CASCADE_CONFIDENCE_THRESHOLD):
+        self.stage1 = stage1
+        self.stage2 = stage2
+        self.threshold = threshold
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with metrics_service.timed("cascade_stage1"):
+            probs = self.stage1.predict(batch)
+        uncertain = np.flatnonzero(probs.max(axis=1) < self.threshold)
+        metrics_service.cascade_predictions.inc("stage1", amount=len(batch) - len(uncertain))
+        if len(uncertain):
+            metrics_service.cascade_predictions.inc("stage2", amount=len(uncertain))
+            with metrics_service.timed("cascade_stage2"):
+                probs[uncertain] = self.stage2.predict(batch[uncertain])
+        return probs
+
+
+BACKENDS = ("keras",) + tuple(TFLITE_MODEL_PATHS) + ("cascade",)
+
+
+def create_backend(name: str):
+    """Builds the inference backend selected by INFERENCE_BACKEND."""
+    if name == "keras":
+        return KerasBackend()
+    if name in TFLITE_MODEL_PATHS:
+        return TFLiteBackend(name, TFLITE_MODEL_PATHS[name])
+    if name == "cascade":
+        if CASCADE_STAGE2_BACKEND == "cascade":
+            raise ValueError("CASCADE_STAGE2_BACKEND cannot itself be 'cascade'")
+        stage1 = load_model_file("cascade-stage1", CASCADE_STAGE1_MODEL_PATH)
+        return CascadeBackend(stage1, create_backend(CASCADE_STAGE2_BACKEND))
+    raise ValueError(f"Unknown inference backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
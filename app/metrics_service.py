@@ -0,0 +1,227 @@
+# app/metrics_service.py
+"""
+Lightweight in-process metrics with Prometheus text exposition, plus optional
+Server-Timing response headers. Everything here is a lock-protected counter update,
+so it is cheap enough to leave on in production.
+"""
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from starlette.routing import Match
+
+# Adds a Server-Timing header with per-stage durations to every response
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "0") == "1"
+
+# Stage timings of the current request, read by MetricsMiddleware for Server-Timing
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(labelnames, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    @contextmanager
+    def track(self, *labels):
+        """Counts the block as in flight while it runs."""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, *labels, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = self.header()
+        names = self.labelnames + ("le",)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+_registry = []
+# Callbacks producing gauges computed at scrape time, e.g. cache hit ratios
+_collectors = []
+
+
+def register_collector(func):
+    """Registers a function returning a list of (name, help, labels dict, value) gauge samples."""
+    _collectors.append(func)
+    return func
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    # Samples of one metric must be contiguous, so group collector output by name
+    families = {}
+    for collect in _collectors:
+        try:
+            samples = collect()
+        except Exception as e:
+            lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {e}")
+            continue
+        for name, help_text, labels, value in samples:
+            family = families.setdefault(name, [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"])
+            family.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    for family in families.values():
+        lines.extend(family)
+    return "\n".join(lines) + "\n"
+
+
+# --- Application metrics ---
+http_requests = Counter("agro_http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status"))
+http_duration = Histogram("agro_http_request_duration_seconds", "HTTP request latency until the response starts.", ("route",))
+stage_duration = Histogram("agro_stage_duration_seconds", "Duration of analysis pipeline stages.", ("stage",))
+in_flight = Gauge("agro_in_flight", "Operations currently in progress.", ("operation",))
+model_batch_size = Histogram("agro_model_batch_size", "Images per model call.", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+admission_wait = Histogram("agro_admission_queue_wait_seconds", "Time admitted requests waited for a slot.", ("controller",))
+admission_rejected = Counter("agro_admission_rejected_total", "Requests turned away by admission control.", ("controller", "reason"))
+admission_queued = Gauge("agro_admission_queue_depth", "Requests waiting for an admission slot.", ("controller",))
+cascade_predictions = Counter("agro_cascade_predictions_total", "Images answered by each cascade stage.", ("stage",))
+
+
+def record_stage(stage: str, seconds: float):
+    stage_duration.observe(stage, value=seconds)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str):
+    """Times the block into the stage histogram (and the request's Server-Timing header)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def _route_label(app, scope) -> str:
+    # Use the route template (e.g. /password-recovery/{email}) so labels stay low-cardinality
+    partial = None
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+        if match == Match.PARTIAL and partial is None:
+            partial = route  # Path matched but the method did not (405)
+    return getattr(partial, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts/latency and emitting Server-Timing headers."""
+
+    def __init__(self, app, fastapi_app=None):
+        self.app = app
+        self.fastapi_app = fastapi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stages = []
+        token = _request_stages.set(stages)
+        start = time.perf_counter()
+        route = _route_label(self.fastapi_app, scope) if self.fastapi_app is not None else scope["path"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed = time.perf_counter() - start
+                http_duration.observe(route, value=elapsed)
+                if SERVER_TIMING_ENABLED:
+                    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages]
+                    entries.append(f"total;dur={elapsed * 1000:.2f}")
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"server-timing", ", ".join(entries).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests.inc(route, scope["method"], str(status_code))
+            _request_stages.reset(token)
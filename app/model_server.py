@@ -0,0 +1,210 @@
+# app/model_server.py
+"""
+Optional model-server mode. One process (or a few) owns the model; API workers send
+preprocessed tensors to it instead of each loading TensorFlow and their own copy of
+the model. Start a server with
+
+    python -m app.model_server --address /tmp/agro-model.sock
+
+and point the API workers at it with MODEL_SERVER_ADDRESS (comma-separate several
+addresses to spread connections over several servers). Without MODEL_SERVER_ADDRESS,
+prediction_service runs the model in-process as before.
+
+Protocol, over a multiprocessing.connection Unix socket:
+- On connect the server allocates a shared-memory block sized for one (224, 224, 3)
+  float32 tensor and sends its name; the client attaches to it.
+- ("predict",): the client has written a tensor into the block; the server answers
+  (class index, confidence). Requests from all connections share one batching engine.
+- ("status",): the server answers {"backend", "loaded", "warm"}.
+"""
+import os
+import time
+import queue
+import argparse
+import threading
+import itertools
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Listener, Client
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+TENSOR_SHAPE = (224, 224, 3)
+TENSOR_DTYPE = np.float32
+TENSOR_BYTES = int(np.prod(TENSOR_SHAPE)) * np.dtype(TENSOR_DTYPE).itemsize
+
+# Shared secret for the socket handshake; set the same value on servers and API workers
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "agro-model-server").encode()
+# How long API workers wait for a model server to come up at startup
+MODEL_SERVER_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MODEL_SERVER_CONNECT_TIMEOUT_SECONDS", 60))
+
+
+def _tensor_view(shm: SharedMemory) -> np.ndarray:
+    return np.ndarray(TENSOR_SHAPE, dtype=TENSOR_DTYPE, buffer=shm.buf)
+
+
+# --- Server ---
+
+def _serve_connection(conn, prediction_service):
+    shm = SharedMemory(create=True, size=TENSOR_BYTES)
+    tensor = _tensor_view(shm)
+    try:
+        conn.send(("ok", shm.name))
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            if request[0] == "predict":
+                try:
+                    # Copy out of the block so no view outlives the connection
+                    preds = prediction_service.predict_probabilities(tensor.copy())
+                    conn.send(("result", int(np.argmax(preds)), float(np.max(preds))))
+                except Exception as e:
+                    conn.send(("error", str(e) or type(e).__name__))
+            elif request[0] == "status":
+                conn.send(("status", {
+                    "backend": prediction_service.INFERENCE_BACKEND,
+                    "loaded": prediction_service.backend is not None,
+                    "warm": prediction_service.is_warm(),
+                }))
+            else:
+                conn.send(("error", f"unknown request {request[0]!r}"))
+    except (OSError, EOFError):
+        pass  # Client went away
+    finally:
+        del tensor
+        conn.close()
+        shm.close()
+        shm.unlink()
+
+
+def serve(address: str):
+    """Loads and warms the model, then answers prediction requests until interrupted."""
+    from app import prediction_service
+
+    if os.path.exists(address):
+        os.unlink(address)  # Stale socket of a previous run
+    listener = Listener(address, family="AF_UNIX", authkey=MODEL_SERVER_AUTHKEY)
+    # Accept connections while the model loads; status reports warm=False until it is done
+    threading.Thread(target=prediction_service.warmup_local, name="model-warmup", daemon=True).start()
+    print(f"Model server ({prediction_service.INFERENCE_BACKEND}) listening on {address}")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # e.g. a client with the wrong authkey; keep serving the others
+                print(f"Rejected model server connection. Error: {e}")
+                continue
+            threading.Thread(
+                target=_serve_connection, args=(conn, prediction_service), name="model-conn", daemon=True
+            ).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        prediction_service.shutdown()
+
+
+# --- Client ---
+
+class _Connection:
+    def __init__(self, address: str):
+        self.conn = Client(address, family="AF_UNIX", authkey=MODEL_SERVER_AUTHKEY)
+        _, name = self.conn.recv()
+        self.shm = SharedMemory(name=name)
+        # The server owns (and unlinks) the block; keep our resource tracker from removing it too
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.tensor = _tensor_view(self.shm)
+
+    def request(self, message: tuple):
+        self.conn.send(message)
+        reply = self.conn.recv()
+        if reply[0] == "error":
+            raise RuntimeError(f"Model server error: {reply[1]}")
+        return reply[1:]
+
+    def close(self):
+        self.tensor = None
+        try:
+            self.conn.close()
+        finally:
+            self.shm.close()
+
+
+class ModelServerClient:
+    """
+    Thread-safe client. Keeps a pool of connections (each with its own shared-memory
+    block), so concurrent callers never wait on each other's round trips; new
+    connections are spread round-robin over the server addresses.
+    """
+
+    def __init__(self, addresses: list):
+        self.addresses = [a.strip() for a in addresses if a.strip()]
+        self._next_address = itertools.cycle(self.addresses)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> _Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                address = next(self._next_address)
+            return _Connection(address)
+
+    def _call(self, message: tuple, fill: np.ndarray = None):
+        connection = self._acquire()
+        try:
+            if fill is not None:
+                connection.tensor[...] = fill
+            result = connection.request(message)
+        except (OSError, EOFError):
+            # Broken connection (e.g. the server restarted); don't put it back
+            connection.close()
+            raise
+        except RuntimeError:
+            # The server answered with an error; the connection itself is still usable
+            self._idle.put(connection)
+            raise
+        self._idle.put(connection)
+        return result
+
+    def predict(self, img_array: np.ndarray) -> tuple:
+        """(class index, confidence) for one preprocessed (224, 224, 3) image."""
+        return tuple(self._call(("predict",), fill=img_array))
+
+    def status(self) -> dict:
+        """Status of one server, or {} if none is reachable."""
+        try:
+            return self._call(("status",))[0]
+        except (OSError, EOFError, RuntimeError):
+            return {}
+
+    def wait_until_ready(self, timeout: float = MODEL_SERVER_CONNECT_TIMEOUT_SECONDS):
+        """Blocks until a server reports a warm model; raises TimeoutError otherwise."""
+        deadline = time.monotonic() + timeout
+        while not self.status().get("warm"):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No warm model server at {', '.join(self.addresses)}")
+            time.sleep(0.5)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the plant disease model to API workers over a Unix socket")
+    parser.add_argument("--address", default=os.getenv("MODEL_SERVER_ADDRESS", "/tmp/agro-model.sock").split(",")[0])
+    args = parser.parse_args()
+    # This process is the server, so it must run the model itself
+    os.environ.pop("MODEL_SERVER_ADDRESS", None)
+    serve(args.address)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# app/otp_service.py
+import os
+import hmac
+import hashlib
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from app import database
+
+# --- OTP store configuration ---
+# "database" shares OTPs between all workers (and hosts) through the otp_tokens table;
+# "memory" keeps them in this process only, which needs sticky sessions with >1 worker.
+OTP_STORE_BACKEND = os.getenv("OTP_STORE_BACKEND", "database")
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", 300))
+# Wrong codes allowed before the OTP is invalidated and a new one must be requested
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", 5))
+OTP_SWEEP_INTERVAL_SECONDS = float(os.getenv("OTP_SWEEP_INTERVAL_SECONDS", 60))
+
+# Outcomes of OTPStore.verify
+OTP_OK = "ok"
+OTP_MISSING = "missing"
+OTP_EXPIRED = "expired"
+OTP_INVALID = "invalid"
+OTP_LOCKED = "locked"
+
+_SECRET = os.getenv("SECRET_KEY", "your-super-secret-key").encode()
+
+
+def _hash_code(key: str, code) -> str:
+    # Only a keyed hash is stored, so a leaked table or memory dump does not reveal live codes
+    return hmac.new(_SECRET, f"{key}:{code}".encode(), hashlib.sha256).hexdigest()
+
+
+class MemoryOTPStore:
+    """Per-process store. Simple, but OTPs are invisible to other workers."""
+
+    def __init__(self):
+        self._entries = {}  # key -> [code_hash, expires_at, attempts]
+        self._lock = threading.Lock()
+
+    def issue(self, key: str, code, ttl_seconds: int = OTP_TTL_SECONDS):
+        with self._lock:
+            self._entries[key] = [_hash_code(key, code), datetime.utcnow() + timedelta(seconds=ttl_seconds), 0]
+
+    def verify(self, key: str, code) -> str:
+        """Checks a code, consuming the OTP on success. Returns one of the OTP_* outcomes."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return OTP_MISSING
+            if datetime.utcnow() > entry[1]:
+                del self._entries[key]
+                return OTP_EXPIRED
+            if hmac.compare_digest(entry[0], _hash_code(key, code)):
+                del self._entries[key]
+                return OTP_OK
+            entry[2] += 1
+            if entry[2] >= OTP_MAX_ATTEMPTS:
+                del self._entries[key]
+                return OTP_LOCKED
+            return OTP_INVALID
+
+    def sweep(self) -> int:
+        """Removes expired OTPs and returns how many were dropped."""
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if now > entry[1]]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class DatabaseOTPStore:
+    """Stores OTPs in the otp_tokens table so every worker sees the same state."""
+
+    def issue(self, key: str, code, ttl_seconds: int = OTP_TTL_SECONDS):
+        db = database.SessionLocal()
+        try:
+            token = db.get(database.OTPToken, key)
+            if token is None:
+                token = database.OTPToken(key=key)
+                db.add(token)
+            token.code_hash = _hash_code(key, code)
+            token.expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+            token.attempts = 0
+            db.commit()
+        finally:
+            db.close()
+
+    def verify(self, key: str, code) -> str:
+        """Checks a code, consuming the OTP on success. Returns one of the OTP_* outcomes."""
+        db = database.SessionLocal()
+        try:
+            # Lock the row so concurrent guesses on different workers are counted correctly
+            token = db.query(database.OTPToken).filter(database.OTPToken.key == key).with_for_update().first()
+            if token is None:
+                return OTP_MISSING
+            if datetime.utcnow() > token.expires_at:
+                db.delete(token)
+                db.commit()
+                return OTP_EXPIRED
+            if hmac.compare_digest(token.code_hash, _hash_code(key, code)):
+                db.delete(token)
+                db.commit()
+                return OTP_OK
+            token.attempts += 1
+            outcome = OTP_INVALID
+            if token.attempts >= OTP_MAX_ATTEMPTS:
+                db.delete(token)
+                outcome = OTP_LOCKED
+            db.commit()
+            return outcome
+        finally:
+            db.close()
+
+    def sweep(self) -> int:
+        """Removes expired OTPs and returns how many were dropped."""
+        db = database.SessionLocal()
+        try:
+            removed = db.query(database.OTPToken).filter(
+                database.OTPToken.expires_at < datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+
+STORES = {
+    "memory": MemoryOTPStore,
+    "database": DatabaseOTPStore,
+}
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = STORES[OTP_STORE_BACKEND]()
+    return _store
+
+
+async def sweep_forever():
+    """Background task that periodically drops expired OTPs. Started from the app lifespan."""
+    while True:
+        await asyncio.sleep(OTP_SWEEP_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(get_store().sweep)
+        except Exception as e:
+            print(f"OTP sweep failed. Error: {e}")
@@ -1,16 +1,37 @@
 # app/prediction_service.py
 import os
 import json
-import io
+import queue
+import threading
+import time
+from concurrent.futures import Future
 import numpy as np
-from PIL import Image
-import tensorflow as tf
+
+from app.preprocessing_service import ensure_prepared
+from app import inference_backends, metrics_service, model_server
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, "..", "models", "plant_disease_model.h5")
 CLASS_PATH = os.path.join(BASE_DIR, "..", "models", "class_indices.json")
 
-model = tf.keras.models.load_model(MODEL_PATH, compile=False)
+# --- Micro-batching configuration ---
+# Requests arriving within MAX_WAIT_MS of each other are run through the model
+# together, up to MAX_BATCH_SIZE images per call. A batch size of 1 disables batching.
+MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", 16))
+MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", 5))
+
+# Which model runtime to use: "keras" (the original .h5), "tflite-fp16", "tflite-int8"
+# or "cascade" (a small first-stage model backed by the full one)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras")
+
+# Unix socket(s) of model server processes (see app.model_server). When set, this
+# process never loads the model and sends preprocessed tensors to the servers instead.
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "")
+
+# The backend (and TensorFlow with it) is loaded on first use or by warmup(),
+# so importing this module stays cheap and the API can start serving right away.
+backend = None
+_backend_lock = threading.Lock()
+_warm = False
 
 with open(CLASS_PATH, "r") as f:
     class_indices = json.load(f)
@@ -18,18 +39,183 @@ with open(CLASS_PATH, "r") as f:
 index_to_class = {int(k): v for k, v in class_indices.items()}
 
 
-def predict_disease(image_bytes: bytes):
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    img = img.resize((224, 224))
+def get_backend():
+    """Returns the inference backend, loading the model on the first call."""
+    global backend
+    if backend is None:
+        with _backend_lock:
+            if backend is None:
+                backend = inference_backends.create_backend(INFERENCE_BACKEND)
+    return backend
+
+
+_model_client = None
+
+
+def get_model_client():
+    """The model server client, or None when inference runs in this process."""
+    global _model_client
+    if _model_client is None and MODEL_SERVER_ADDRESS:
+        with _backend_lock:
+            if _model_client is None:
+                _model_client = model_server.ModelServerClient(MODEL_SERVER_ADDRESS.split(","))
+    return _model_client
+
+
+def is_loaded() -> bool:
+    client = get_model_client()
+    if client is not None:
+        return client.status().get("loaded", False)
+    return backend is not None
+
+
+def is_warm() -> bool:
+    client = get_model_client()
+    if client is not None:
+        return client.status().get("warm", False)
+    return _warm
+
+
+def _run_model(batch: np.ndarray) -> np.ndarray:
+    """Runs one forward pass over a (N, 224, 224, 3) batch and returns the class probabilities."""
+    return get_backend().predict(batch)
+
+
+class BatchingEngine:
+    """
+    Queues single images from concurrent callers and runs them through the model
+    together. Each caller gets a Future that resolves to its own row of predictions.
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int, max_wait_ms: float):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="prediction-batcher", daemon=True)
+                self._thread.start()
 
-    img_array = np.array(img) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
+    def submit(self, img_array: np.ndarray) -> Future:
+        """Queues a single (224, 224, 3) image and returns a Future for its prediction row."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((img_array, future))
+        return future
 
-    preds = model.predict(img_array)
-    idx = int(np.argmax(preds))
-    confidence = float(np.max(preds))
+    def shutdown(self, timeout: float = 5.0):
+        """Stops the worker thread after it has drained the requests already queued."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch):
+        # Skip callers that gave up while they were waiting in the queue
+        batch = [(arr, fut) for arr, fut in batch if fut.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        metrics_service.model_batch_size.observe(value=len(batch))
+        try:
+            with metrics_service.in_flight.track("model_call"), metrics_service.timed("model"):
+                preds = self.predict_fn(np.stack([arr for arr, _ in batch]))
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for (_, fut), row in zip(batch, preds):
+            fut.set_result(row)
+
+
+batcher = BatchingEngine(_run_model, MAX_BATCH_SIZE, MAX_WAIT_MS)
+
+
+def predict_batch(images: np.ndarray) -> np.ndarray:
+    """Runs a batch of preprocessed images straight through the model, bypassing the queue."""
+    return _run_model(images)
+
+
+def predict_probabilities(img_array: np.ndarray) -> np.ndarray:
+    """Class probabilities of one (224, 224, 3) image from the in-process model."""
+    if batcher.max_batch_size > 1:
+        return batcher.submit(img_array).result()
+    metrics_service.model_batch_size.observe(value=1)
+    with metrics_service.in_flight.track("model_call"), metrics_service.timed("model"):
+        return _run_model(np.expand_dims(img_array, axis=0))[0]
+
+
+def predict_disease(image):
+    """Predicts the disease from raw upload bytes or a PreparedImage."""
+    img_array = ensure_prepared(image).tensor
+
+    # "predict" includes the time spent waiting for a batch to fill; "model" is the forward pass alone
+    with metrics_service.timed("predict"):
+        client = get_model_client()
+        if client is not None:
+            idx, confidence = client.predict(img_array)
+        else:
+            preds = predict_probabilities(img_array)
+            idx = int(np.argmax(preds))
+            confidence = float(np.max(preds))
 
     return {
         "disease_name": index_to_class.get(idx, "Unknown Disease"),
         "confidence": confidence
     }
+
+
+def warmup():
+    """Makes sure the model is ready: in-process, or on the model server when one is configured."""
+    client = get_model_client()
+    if client is not None:
+        client.wait_until_ready()
+    else:
+        warmup_local()
+
+
+def warmup_local():
+    """
+    Loads the model and runs dummy inferences at batch size 1 and the maximum batch
+    size, so graph tracing (and TFLite tensor allocation at the largest size) happens
+    before the first real request instead of during it.
+    """
+    global _warm
+    for batch_size in sorted({1, batcher.max_batch_size}):
+        _run_model(np.zeros((batch_size, 224, 224, 3), dtype=np.float32))
+    _warm = True
+
+
+def shutdown():
+    """Stops the batching worker and closes model server connections. Call this at shutdown."""
+    batcher.shutdown()
+    if _model_client is not None:
+        _model_client.close()
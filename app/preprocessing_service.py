@@ -0,0 +1,58 @@
+# app/preprocessing_service.py
+import os
+import io
+import numpy as np
+from PIL import Image
+
+from app.metrics_service import timed
+
+MODEL_INPUT_SIZE = (224, 224)
+
+# Square size the severity analysis segments images at
+SEVERITY_WORK_SIZE = int(os.getenv("SEVERITY_WORK_SIZE", 320))
+# Smallest side the decoded image needs. JPEGs bigger than this are decoded at 1/2,
+# 1/4 or 1/8 scale straight from the DCT coefficients, which is far cheaper than
+# decoding a 12MP phone photo at full resolution and shrinking it afterwards.
+SEVERITY_DECODE_SIDE = int(os.getenv("SEVERITY_DECODE_SIDE", max(SEVERITY_WORK_SIZE, MODEL_INPUT_SIZE[0])))
+
+
+class PreparedImage:
+    """
+    An uploaded image decoded exactly once, with the views each service needs:
+    - rgb: (H, W, 3) uint8 array in RGB order, used by the severity analysis
+    - tensor: (224, 224, 3) float32 array scaled to [0, 1], used by the model
+    Both arrays are read-only so they can be shared between worker threads.
+    """
+
+    __slots__ = ("rgb", "tensor")
+
+    def __init__(self, rgb: np.ndarray, tensor: np.ndarray):
+        self.rgb = rgb
+        self.tensor = tensor
+
+
+def prepare_image(image_bytes: bytes) -> PreparedImage:
+    """Decodes the upload once and builds the model tensor and the severity view from it."""
+    with timed("decode"):
+        img = Image.open(io.BytesIO(image_bytes))
+        # Only has an effect on JPEGs: picks the smallest DCT scale that still covers the target
+        img.draft("RGB", (SEVERITY_DECODE_SIDE, SEVERITY_DECODE_SIDE))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        rgb = np.asarray(img)
+        rgb.flags.writeable = False
+
+    with timed("resize"):
+        tensor = np.asarray(img.resize(MODEL_INPUT_SIZE), dtype=np.float32)
+        tensor /= 255.0
+        tensor.flags.writeable = False
+
+    return PreparedImage(rgb, tensor)
+
+
+def ensure_prepared(image) -> PreparedImage:
+    """Accepts either raw upload bytes or an already prepared image."""
+    if isinstance(image, PreparedImage):
+        return image
+    return prepare_image(image)
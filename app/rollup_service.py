@@ -0,0 +1,153 @@
+# app/rollup_service.py
+"""
+Pre-aggregated diagnosis counts per (day, disease, grid cell), kept up to date as
+logs are inserted so trend views never have to scan diagnosis_logs.
+
+Rebuild or backfill from the raw logs with:
+
+    python -m app.rollup_service rebuild [--since YYYY-MM-DD]
+"""
+import os
+import argparse
+import datetime
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import database
+
+# Grid cell size of the rollups in degrees (~11 km). Changing it requires a rebuild.
+ROLLUP_CELL_DEG = float(os.getenv("ROLLUP_CELL_DEG", 0.1))
+# Cell index used for logs without coordinates, so they still count towards trends
+NO_LOCATION_CELL = -1
+
+_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def cell_for(latitude: Optional[float], longitude: Optional[float]) -> tuple:
+    """Rollup grid cell of a coordinate, as (lat index, lon index)."""
+    if latitude is None or longitude is None:
+        return NO_LOCATION_CELL, NO_LOCATION_CELL
+    return int((latitude + 90.0) // ROLLUP_CELL_DEG), int((longitude + 180.0) // ROLLUP_CELL_DEG)
+
+
+def _increments(logs) -> dict:
+    """Folds diagnosis logs into {(day, disease, cell_lat, cell_lon): [count, severity_sum]}."""
+    increments = {}
+    for log in logs:
+        key = (log.timestamp.date(), log.disease_name, *cell_for(log.latitude, log.longitude))
+        entry = increments.setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] += log.severity or 0.0
+    return increments
+
+
+def _apply(db, increments: dict):
+    if not increments:
+        return
+    Rollup = database.DiagnosisRollup
+    rows = [
+        {"day": day, "disease_name": disease, "cell_lat": cell_lat, "cell_lon": cell_lon,
+         "count": count, "severity_sum": severity_sum}
+        for (day, disease, cell_lat, cell_lon), (count, severity_sum) in increments.items()
+    ]
+    insert = _INSERTS.get(db.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(Rollup).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", "disease_name", "cell_lat", "cell_lon"],
+            set_={
+                "count": Rollup.count + stmt.excluded.count,
+                "severity_sum": Rollup.severity_sum + stmt.excluded.severity_sum,
+            },
+        )
+        db.execute(stmt)
+        return
+
+    # Databases without ON CONFLICT support: read-modify-write each row
+    for row in rows:
+        existing = db.get(Rollup, (row["day"], row["disease_name"], row["cell_lat"], row["cell_lon"]))
+        if existing is None:
+            db.add(Rollup(**row))
+        else:
+            existing.count += row["count"]
+            existing.severity_sum += row["severity_sum"]
+    db.flush()
+
+
+def record_diagnoses(db, logs):
+    """
+    Adds newly inserted logs to the rollups. Runs inside the caller's transaction,
+    so the rollups commit (or roll back) together with the logs themselves.
+    """
+    _apply(db, _increments(logs))
+
+
+def rebuild_rollups(db, since: Optional[datetime.date] = None, batch_size: int = 10000) -> int:
+    """
+    Recomputes the rollups from diagnosis_logs, for every day or from `since` onwards.
+    Returns the number of logs scanned. Commits when done.
+    """
+    Log = database.DiagnosisLog
+    Rollup = database.DiagnosisRollup
+
+    delete = db.query(Rollup)
+    logs = db.query(Log).filter(Log.timestamp.isnot(None))
+    if since is not None:
+        delete = delete.filter(Rollup.day >= since)
+        logs = logs.filter(Log.timestamp >= datetime.datetime.combine(since, datetime.time.min))
+    delete.delete(synchronize_session=False)
+
+    increments = _increments(logs.yield_per(batch_size))
+    _apply(db, increments)
+    db.commit()
+    return sum(count for count, _ in increments.values())
+
+
+def trend_series(
+    db,
+    start_day: datetime.date,
+    disease_name: Optional[str] = None,
+    bbox: Optional[tuple] = None,
+) -> list:
+    """Daily counts and mean severity from start_day onwards, read from the rollups only."""
+    Rollup = database.DiagnosisRollup
+    query = db.query(Rollup.day, func.sum(Rollup.count), func.sum(Rollup.severity_sum)).filter(Rollup.day >= start_day)
+    if disease_name:
+        query = query.filter(Rollup.disease_name == disease_name)
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        min_cell = cell_for(min_lat, min_lon)
+        max_cell = cell_for(max_lat, max_lon)
+        query = query.filter(
+            Rollup.cell_lat.between(min_cell[0], max_cell[0]),
+            Rollup.cell_lon.between(min_cell[1], max_cell[1]),
+        )
+    rows = query.group_by(Rollup.day).order_by(Rollup.day).all()
+    return [
+        {"day": day, "count": count, "mean_severity": (severity_sum or 0.0) / count if count else 0.0}
+        for day, count, severity_sum in rows
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the diagnosis rollup tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="Recompute rollups from diagnosis_logs")
+    p_rebuild.add_argument("--since", type=datetime.date.fromisoformat, help="Only rebuild from this day (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    database.create_db_and_tables()
+    db = database.SessionLocal()
+    try:
+        scanned = rebuild_rollups(db, since=args.since)
+        print(f"Rebuilt rollups from {scanned} diagnosis logs")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, date
+from typing import Optional, Dict, List
 
 # ---------------- USERS ----------------
 class UserBase(BaseModel):
@@ -34,6 +34,19 @@ class DiagnosisLogCreate(BaseModel):
     latitude: float
     longitude: float
 
+class DiagnosisLogSyncItem(DiagnosisLogCreate):
+    client_id: str  # Generated by the app; makes retried syncs idempotent
+    recorded_at: Optional[datetime] = None  # When the diagnosis was made offline
+
+class DiagnosisLogBulkCreate(BaseModel):
+    records: List[DiagnosisLogSyncItem]
+
+class DiagnosisSyncResult(BaseModel):
+    client_id: str
+    status: str  # "created", "duplicate" or "rejected"
+    log_id: Optional[int] = None
+    detail: Optional[str] = None
+
 class DiagnosisLog(BaseModel):
     id: int
     disease_name: str
@@ -45,6 +58,31 @@ class DiagnosisLog(BaseModel):
     class Config:
         orm_mode = True
 
+class HotspotCell(BaseModel):
+    latitude: float  # Cell center
+    longitude: float
+    cell_size: float  # Degrees
+    count: int
+    mean_severity: float
+    top_disease: str
+    disease_counts: Dict[str, int]
+
+class TrendPoint(BaseModel):
+    day: date
+    count: int
+    mean_severity: float
+
+
+# ---------------- ECONOMIC IMPACT ----------------
+class ImpactItem(BaseModel):
+    disease_name: str
+    severity: float
+    region: Optional[str] = None
+    acres: float = 1.0
+
+class ImpactBatchRequest(BaseModel):
+    items: List[ImpactItem]
+
 
 # ---------------- FEEDBACK ----------------
 class FeedbackCreate(BaseModel):
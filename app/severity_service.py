@@ -1,45 +1,187 @@
+# app/severity_service.py
+
+# Severity is the share of diseased pixels in the visible leaf area, found by HSV
+# color segmentation. The HSV ranges come from data/severity_profiles.json:
+# - 'default': ranges used for any disease without its own profile.
+# - 'crops': per-crop overrides, keyed by the class name prefix (e.g. "Tomato").
+# - 'diseases': per-class overrides (e.g. "Tomato___Late_blight").
+# Each profile has 'healthy' and 'disease' lists of {"lower": [h, s, v], "upper": [h, s, v]}
+# ranges in OpenCV units (H 0-179, S and V 0-255); a pixel matching any range counts.
+# Missing keys fall back from disease to crop to default. A range whose lower hue is
+# above its upper hue wraps around red (e.g. 170 -> 10).
+
+import os
+import json
+import threading
+from typing import Optional
 import numpy as np
 import cv2
 
-def analyze_severity(image_bytes: bytes) -> float:
+from app.preprocessing_service import ensure_prepared, SEVERITY_WORK_SIZE
+from app.metrics_service import timed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEVERITY_PROFILES_PATH = os.getenv(
+    "SEVERITY_PROFILES_PATH", os.path.join(BASE_DIR, "..", "data", "severity_profiles.json")
+)
+# Each distinct range is one bit of an int32 pixel code
+MAX_RANGES = 32
+
+
+class SeverityEngine:
+    """
+    Compiles every distinct HSV range of all profiles into one bit each, with a lookup
+    table per channel (H, S, V) giving the bits whose range contains that value.
+    ANDing the three lookups yields, per pixel, the set of ranges it falls into, so
+    one pass over the image serves every profile; a profile is then just two bit masks.
+    Images are first shrunk to SEVERITY_WORK_SIZE squared: pixel shares barely change
+    with resolution, and the cost stays the same for any camera.
+    """
+
+    def __init__(self, config: dict):
+        self._ranges = {}  # (lower, upper) -> bit index
+
+        self.default = self._compile(config["default"], None)
+        self.crops = {
+            crop: self._compile(profile, self.default) for crop, profile in config.get("crops", {}).items()
+        }
+        self.diseases = {}
+        for disease, profile in config.get("diseases", {}).items():
+            crop = disease.partition("___")[0]
+            self.diseases[disease] = self._compile(profile, self.crops.get(crop, self.default))
+
+        if len(self._ranges) > MAX_RANGES:
+            raise ValueError(f"At most {MAX_RANGES} distinct HSV ranges are supported, got {len(self._ranges)}")
+        # One 256-entry table per HSV channel, applied to all three at once by cv2.LUT
+        lut = np.zeros((256, 3), dtype=np.uint32)
+        for (lower, upper), bit in self._ranges.items():
+            flag = np.uint32(1 << bit)
+            if lower[0] <= upper[0]:
+                lut[lower[0]:upper[0] + 1, 0] |= flag
+            else:
+                lut[lower[0]:180, 0] |= flag
+                lut[:upper[0] + 1, 0] |= flag
+            lut[lower[1]:upper[1] + 1, 1] |= flag
+            lut[lower[2]:upper[2] + 1, 2] |= flag
+        self.lut = lut.view(np.int32).reshape(1, 256, 3)
+
+        # Masks were collected as Python ints; store them with the codes' bit layout
+        self.default = self._as_masks(self.default)
+        self.crops = {k: self._as_masks(v) for k, v in self.crops.items()}
+        self.diseases = {k: self._as_masks(v) for k, v in self.diseases.items()}
+
+    def _bits(self, ranges: list) -> int:
+        bits = 0
+        for r in ranges:
+            lower, upper = tuple(int(x) for x in r["lower"]), tuple(int(x) for x in r["upper"])
+            if len(lower) != 3 or len(upper) != 3 or not (0 <= lower[0] < 180 and 0 <= upper[0] < 180):
+                raise ValueError(f"Invalid HSV range {r}")
+            if not all(0 <= lower[i] <= upper[i] <= 255 for i in (1, 2)):
+                raise ValueError(f"Invalid HSV range {r}")
+            bit = self._ranges.setdefault((lower, upper), len(self._ranges))
+            bits |= 1 << bit
+        return bits
+
+    def _compile(self, profile: dict, parent: Optional[tuple]) -> tuple:
+        healthy = self._bits(profile["healthy"]) if "healthy" in profile else parent[0]
+        disease = self._bits(profile["disease"]) if "disease" in profile else parent[1]
+        return healthy, disease
+
+    @staticmethod
+    def _as_masks(bits: tuple) -> tuple:
+        return tuple(np.array(b, dtype=np.uint32).view(np.int32)[()] for b in bits)
+
+    def profile(self, disease_name: Optional[str]) -> tuple:
+        """(healthy bits, disease bits) for a predicted class name."""
+        if not disease_name:
+            return self.default
+        masks = self.diseases.get(disease_name)
+        if masks is None:
+            masks = self.crops.get(disease_name.partition("___")[0], self.default)
+        return masks
+
+    def encode(self, rgb: np.ndarray) -> np.ndarray:
+        """Per-pixel range bits of one RGB image, at the working resolution."""
+        return self.encode_batch([rgb])[0]
+
+    def encode_batch(self, rgbs: list) -> np.ndarray:
+        """Per-pixel range bits of many RGB images, as one (N, size, size) array."""
+        size = SEVERITY_WORK_SIZE
+        stack = np.empty((len(rgbs), size, size, 3), dtype=np.uint8)
+        for i, rgb in enumerate(rgbs):
+            # JPEG draft decoding has usually done the heavy shrinking already; below a 2x
+            # reduction bilinear sampling loses nothing and is several times cheaper
+            interpolation = cv2.INTER_AREA if min(rgb.shape[:2]) >= 2 * size else cv2.INTER_LINEAR
+            cv2.resize(rgb, (size, size), dst=stack[i], interpolation=interpolation)
+        # One color conversion and one table lookup over all images, viewed as a single tall image
+        hsv = cv2.cvtColor(stack.reshape(-1, size, 3), cv2.COLOR_RGB2HSV)
+        bits = cv2.LUT(hsv, self.lut).reshape(len(rgbs), size, size, 3)
+        return bits[..., 0] & bits[..., 1] & bits[..., 2]
+
+    def score_batch(self, codes: np.ndarray, disease_names: list) -> np.ndarray:
+        """Severity percentages of encoded images, each scored with its disease's profile."""
+        severities = np.zeros(len(codes))
+        # Counting per image is cheaper than one count over a (N, size, size) temporary
+        for i, (image_codes, name) in enumerate(zip(codes, disease_names)):
+            healthy_bits, disease_bits = self.profile(name)
+            healthy = np.count_nonzero(image_codes & healthy_bits)
+            disease = np.count_nonzero(image_codes & disease_bits)
+            total = healthy + disease
+            if total:  # Avoid division by zero if no leaf is detected
+                severities[i] = disease / total * 100
+        return severities
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def reload() -> SeverityEngine:
+    """Re-reads the profiles file and swaps the engine in atomically."""
+    global _engine
+    with open(SEVERITY_PROFILES_PATH, "r") as f:
+        engine = SeverityEngine(json.load(f))
+    with _engine_lock:
+        _engine = engine
+    return engine
+
+
+def get_engine() -> SeverityEngine:
+    if _engine is None:
+        return reload()
+    return _engine
+
+
+def encode_image(image) -> np.ndarray:
+    """
+    The expensive, profile-independent part of the analysis. Accepts raw upload bytes
+    or a PreparedImage, so it can run before the disease is known.
+    """
+    rgb = ensure_prepared(image).rgb
+    with timed("severity"):
+        return get_engine().encode(rgb)
+
+
+def severity_from_codes(codes: np.ndarray, disease_name: Optional[str] = None) -> float:
+    """Severity percentage of an encode_image result, using the disease's HSV profile."""
+    return float(get_engine().score_batch(codes[np.newaxis], [disease_name])[0])
+
+
+def analyze_severity(image, disease_name: Optional[str] = None) -> float:
     """
     Analyzes the severity of the plant disease from an image using color segmentation.
-    Returns the severity as a percentage.
+    Accepts raw upload bytes or a PreparedImage. Returns the severity as a percentage.
     """
-    # Convert bytes to an OpenCV image
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    # Convert the image from BGR to HSV color space
-    hsv_img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-
-    # --- IMPORTANT: TUNING REQUIRED ---
-    # These HSV color ranges are examples and will need to be carefully tuned 
-    # for the specific types of leaves and diseases in your dataset.
-    
-    # Define HSV range for HEALTHY green parts of a leaf
-    lower_green = np.array([25, 50, 50])
-    upper_green = np.array([85, 255, 255])
-    
-    # Define HSV range for DISEASED parts (e.g., brown/yellow spots)
-    # You might need multiple ranges and combine the masks
-    lower_disease = np.array([10, 80, 80])
-    upper_disease = np.array([30, 255, 255])
-
-    # Create masks to isolate healthy and diseased pixels
-    healthy_mask = cv2.inRange(hsv_img, lower_green, upper_green)
-    disease_mask = cv2.inRange(hsv_img, lower_disease, upper_disease)
-    
-    # Calculate the number of pixels for each category
-    healthy_pixels = cv2.countNonZero(healthy_mask)
-    disease_pixels = cv2.countNonZero(disease_mask)
-
-    # Calculate severity percentage based on visible leaf area
-    total_leaf_pixels = healthy_pixels + disease_pixels
-    
-    if total_leaf_pixels == 0:
-        return 0.0  # Avoid division by zero if no leaf is detected
-
-    severity_percentage = (disease_pixels / total_leaf_pixels) * 100
-    
-    return severity_percentage
\ No newline at end of file
+    return severity_from_codes(encode_image(image), disease_name)
+
+
+def analyze_severity_batch(images: list, disease_names: Optional[list] = None) -> list:
+    """analyze_severity over many images in one vectorized pass."""
+    if not images:
+        return []
+    rgbs = [ensure_prepared(image).rgb for image in images]
+    engine = get_engine()
+    with timed("severity"):
+        codes = engine.encode_batch(rgbs)
+        severities = engine.score_batch(codes, disease_names or [None] * len(images))
+    return severities.tolist()
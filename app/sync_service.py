@@ -0,0 +1,97 @@
+# app/sync_service.py
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import database, rollup_service
+
+# Most records accepted by one /log-diagnosis/bulk/ call
+MAX_SYNC_BATCH = int(os.getenv("MAX_SYNC_BATCH", 1000))
+# Offline timestamps further than this in the future are rejected as clock errors
+MAX_CLOCK_SKEW = timedelta(minutes=int(os.getenv("SYNC_MAX_CLOCK_SKEW_MINUTES", 10)))
+
+
+def _validate(record, recorded_at, now: datetime):
+    """Returns an error message for a record that must not be stored, else None."""
+    if not record.client_id:
+        return "client_id must not be empty"
+    if not -90.0 <= record.latitude <= 90.0 or not -180.0 <= record.longitude <= 180.0:
+        return "latitude/longitude out of range"
+    if not 0.0 <= record.severity <= 100.0:
+        return "severity must be between 0 and 100"
+    if recorded_at is not None and recorded_at > now + MAX_CLOCK_SKEW:
+        return "recorded_at is in the future"
+    return None
+
+
+def ingest_diagnoses(db, owner_id: int, records) -> list:
+    """
+    Stores a batch of offline diagnoses in one transaction and returns one status per
+    record, in input order: "created", "duplicate" (client_id already synced) or
+    "rejected". Retrying a whole batch is safe; already stored records come back as
+    duplicates with their original log_id.
+    """
+    try:
+        return _ingest(db, owner_id, records)
+    except IntegrityError:
+        # A concurrent retry of the same batch stored some client_ids first; the second
+        # pass sees them as duplicates
+        db.rollback()
+        return _ingest(db, owner_id, records)
+
+
+def _ingest(db, owner_id: int, records) -> list:
+    SyncKey = database.DiagnosisSyncKey
+    now = datetime.utcnow()
+
+    client_ids = list({r.client_id for r in records if r.client_id})
+    known = {}
+    if client_ids:
+        known = dict(
+            db.query(SyncKey.client_id, SyncKey.log_id)
+            .filter(SyncKey.owner_id == owner_id, SyncKey.client_id.in_(client_ids))
+            .all()
+        )
+
+    results = []
+    new_logs = []  # (result index, client_id, log)
+    seen = {}
+    for record in records:
+        result = {"client_id": record.client_id, "status": "created", "log_id": None, "detail": None}
+        results.append(result)
+        recorded_at = database.naive_utc(record.recorded_at)
+        error = _validate(record, recorded_at, now)
+        if error:
+            result.update(status="rejected", detail=error)
+        elif record.client_id in known:
+            result.update(status="duplicate", log_id=known[record.client_id])
+        elif record.client_id in seen:
+            result.update(status="duplicate", detail="client_id repeated in this batch")
+            seen[record.client_id].append(result)
+        else:
+            seen[record.client_id] = [result]
+            new_logs.append((result, record.client_id, database.DiagnosisLog(
+                disease_name=record.disease_name,
+                severity=record.severity,
+                latitude=record.latitude,
+                longitude=record.longitude,
+                timestamp=recorded_at or now,
+                owner_id=owner_id,
+            )))
+
+    if new_logs:
+        logs = [log for _, _, log in new_logs]
+        # One flush inserts every log in batched statements and returns their ids
+        db.add_all(logs)
+        db.flush()
+        db.execute(
+            insert(SyncKey),
+            [{"owner_id": owner_id, "client_id": client_id, "log_id": log.id} for _, client_id, log in new_logs],
+        )
+        rollup_service.record_diagnoses(db, logs)
+        db.commit()
+        for _, client_id, log in new_logs:
+            for result in seen[client_id]:
+                result["log_id"] = log.id
+    return results
@@ -1,34 +1,90 @@
 import os
-import google.generativeai as genai
+import asyncio
+import datetime
+import threading
+import functools
 from dotenv import load_dotenv  # <-- ADD THIS IMPORT
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import database
+from app.cache_service import LRUCache
 
 # --- Load environment variables from .env file ---
 load_dotenv() # <-- ADD THIS LINE TO LOAD THE .ENV FILE
 
+# --- Treatment plan configuration ---
+# Which generator writes plans: "gemini" or "local" (an offline template stand-in)
+TREATMENT_GENERATOR = os.getenv("TREATMENT_GENERATOR", "gemini")
+TREATMENT_TIMEOUT_SECONDS = float(os.getenv("TREATMENT_TIMEOUT_SECONDS", 60))
+TREATMENT_CACHE_MAX_ENTRIES = int(os.getenv("TREATMENT_CACHE_MAX_ENTRIES", 512))
+# Stored plans older than this are regenerated
+TREATMENT_CACHE_TTL_DAYS = float(os.getenv("TREATMENT_CACHE_TTL_DAYS", 30))
+# Per-stream limits for /get-treatment/stream/: wall-clock time, total plan size,
+# chunks buffered between the generator thread and the client, and the chunk size
+# used when replaying a cached plan
+TREATMENT_STREAM_MAX_SECONDS = float(os.getenv("TREATMENT_STREAM_MAX_SECONDS", 90))
+TREATMENT_STREAM_MAX_CHARS = int(os.getenv("TREATMENT_STREAM_MAX_CHARS", 64 * 1024))
+TREATMENT_STREAM_BUFFER = int(os.getenv("TREATMENT_STREAM_BUFFER", 16))
+TREATMENT_STREAM_CHUNK_CHARS = int(os.getenv("TREATMENT_STREAM_CHUNK_CHARS", 512))
+
+# Plans are written per severity bucket rather than per exact percentage, so that
+# e.g. 12.3% and 17.8% share one cached plan.
+SEVERITY_BUCKETS = [
+    ("low", 0, 10),
+    ("moderate", 10, 30),
+    ("high", 30, 60),
+    ("severe", 60, 100),
+]
+
 # --- Configure Gemini API ---
-# This now securely loads your key from the .env file
-try:
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    if gemini_api_key:
-        genai.configure(api_key=gemini_api_key)
-        llm_model = genai.GenerativeModel("gemini-2.5-flash")
-    else:
-        llm_model = None
-        print("GEMINI_API_KEY environment variable not found.")
-except Exception as e:
-    llm_model = None
-    print(f"Gemini API could not be configured. Error: {e}")
+# The Gemini client is configured on first use rather than at import time, which keeps
+# the google.generativeai import off the startup path.
+llm_model = None
+_llm_initialized = False
+_llm_lock = threading.Lock()
+
+
+def get_llm_model():
+    """Returns the Gemini model, configuring the client on the first call. None if unavailable."""
+    global llm_model, _llm_initialized
+    if not _llm_initialized:
+        with _llm_lock:
+            if not _llm_initialized:
+                # This now securely loads your key from the .env file
+                try:
+                    gemini_api_key = os.getenv("GEMINI_API_KEY")
+                    if gemini_api_key:
+                        import google.generativeai as genai
+
+                        genai.configure(api_key=gemini_api_key)
+                        llm_model = genai.GenerativeModel("gemini-2.5-flash")
+                    else:
+                        print("GEMINI_API_KEY environment variable not found.")
+                except Exception as e:
+                    llm_model = None
+                    print(f"Gemini API could not be configured. Error: {e}")
+                _llm_initialized = True
+    return llm_model
+
+
+def is_loaded() -> bool:
+    return llm_model is not None
 
 
 # --- Helper Functions ---
-def get_treatment_plan(disease_name: str, severity: float, language: str) -> str:
-    """Uses Gemini API to generate a treatment plan."""
-    if not llm_model:
-        return f"Gemini API not configured. Placeholder plan for {disease_name} in {language}."
+def severity_bucket(severity: float) -> tuple:
+    """Maps a severity percentage to its (label, lower %, upper %) bucket."""
+    for bucket in SEVERITY_BUCKETS:
+        if severity < bucket[2]:
+            return bucket
+    return SEVERITY_BUCKETS[-1]
+
 
-    prompt = (
+def build_prompt(disease_name: str, bucket: tuple, language: str) -> str:
+    label, lower, upper = bucket
+    return (
         f"You are an expert agricultural advisor for farmers in Andhra Pradesh, India. "
-        f"Provide a detailed and practical medication and treatment plan for the plant disease '{disease_name}' with a severity of {severity:.1f}%, written in the {language} language. "
+        f"Provide a detailed and practical medication and treatment plan for the plant disease '{disease_name}' with a {label} severity ({lower}-{upper}% of the leaf area affected), written in the {language} language. "
         f"The plan must be tailored specifically to Indian standards and be easy for a farmer to understand.\n\n"
         f"Crucially, you must follow these rules:\n"
         f"1. **Format the entire response using simple Markdown.** Use `##` for main headings and `*` for bullet points. Do not use complex Markdown.\n"
@@ -40,8 +96,329 @@ def get_treatment_plan(disease_name: str, severity: float, language: str) -> str
         # --- ADD THIS NEW RULE ---
         f"7. **Finally, create a simple '7-Day Action Plan' or checklist based on the severity.** For example: Day 1: Apply [Pesticide A]. Day 3: Monitor leaves. Day 5: Apply [Organic Remedy B]."
     )
-    try:
-        response = llm_model.generate_content(prompt)
+
+
+# --- Plan Generators ---
+class GeminiGenerator:
+    """Writes plans with the Gemini API."""
+
+    name = "gemini"
+
+    def available(self) -> bool:
+        return get_llm_model() is not None
+
+    def generate(self, disease_name: str, bucket: tuple, language: str) -> str:
+        response = get_llm_model().generate_content(build_prompt(disease_name, bucket, language))
         return response.text
-    except Exception as e:
-        return f"Error generating plan for {disease_name} in {language}. Error: {e}"
\ No newline at end of file
+
+    def stream(self, disease_name: str, bucket: tuple, language: str):
+        response = get_llm_model().generate_content(build_prompt(disease_name, bucket, language), stream=True)
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class LocalGenerator:
+    """
+    Offline stand-in for Gemini. Produces a fixed-format Markdown plan so the whole
+    treatment path (caching, deduplication, endpoints) can run without network access.
+    """
+
+    name = "local"
+
+    def available(self) -> bool:
+        return True
+
+    def generate(self, disease_name: str, bucket: tuple, language: str) -> str:
+        crop, _, disease = disease_name.partition("___")
+        disease = (disease or crop).replace("_", " ").strip()
+        label, lower, upper = bucket
+        return (
+            f"## Treatment plan for {disease} ({crop.replace('_', ' ')})\n\n"
+            f"* Severity: {label} ({lower}-{upper}% of the leaf area affected)\n"
+            f"* Language requested: {language}\n\n"
+            f"## Chemical control\n\n"
+            f"* Consult your local agriculture officer for a registered product.\n\n"
+            f"## Organic and home remedies\n\n"
+            f"* Remove and destroy affected leaves.\n\n"
+            f"## Preventive measures\n\n"
+            f"* Avoid overhead irrigation and keep good spacing between plants.\n\n"
+            f"## 7-Day Action Plan\n\n"
+            f"* Day 1: Remove affected leaves.\n"
+            f"* Day 3: Monitor leaves.\n"
+            f"* Day 7: Reassess severity with a new photo.\n"
+        )
+
+    def stream(self, disease_name: str, bucket: tuple, language: str):
+        yield from split_plan(self.generate(disease_name, bucket, language))
+
+
+GENERATORS = {
+    "gemini": GeminiGenerator,
+    "local": LocalGenerator,
+}
+
+_generator = None
+
+
+def get_generator():
+    global _generator
+    if _generator is None:
+        _generator = GENERATORS[TREATMENT_GENERATOR]()
+    return _generator
+
+
+def set_generator(generator):
+    """Replaces the plan generator, e.g. with LocalGenerator() for offline runs."""
+    global _generator
+    _generator = generator
+
+
+# --- Plan Cache ---
+# Plans live in the treatment_plans table so they survive restarts and are shared
+# between workers; an in-process LRU sits in front of it for the hottest keys.
+_plan_cache = LRUCache(TREATMENT_CACHE_MAX_ENTRIES)
+# Generations currently running, so concurrent identical requests share one upstream call
+_inflight = {}
+
+
+def plan_key(generator, disease_name: str, bucket: tuple, language: str) -> tuple:
+    return (disease_name.strip(), bucket[0], language.strip().lower(), generator.name)
+
+
+def _load_plan(key: tuple):
+    disease_name, bucket_label, language, generator_name = key
+    oldest = datetime.datetime.utcnow() - datetime.timedelta(days=TREATMENT_CACHE_TTL_DAYS)
+    db = database.SessionLocal()
+    try:
+        row = db.query(database.TreatmentPlan).filter(
+            database.TreatmentPlan.disease_name == disease_name,
+            database.TreatmentPlan.severity_bucket == bucket_label,
+            database.TreatmentPlan.language == language,
+            database.TreatmentPlan.generator == generator_name,
+            database.TreatmentPlan.created_at >= oldest,
+        ).first()
+        return row.plan if row else None
+    except SQLAlchemyError as e:
+        print(f"Could not read cached treatment plan. Error: {e}")
+        return None
+    finally:
+        db.close()
+
+
+def _save_plan(key: tuple, plan: str):
+    disease_name, bucket_label, language, generator_name = key
+    db = database.SessionLocal()
+    try:
+        row = db.query(database.TreatmentPlan).filter(
+            database.TreatmentPlan.disease_name == disease_name,
+            database.TreatmentPlan.severity_bucket == bucket_label,
+            database.TreatmentPlan.language == language,
+            database.TreatmentPlan.generator == generator_name,
+        ).first()
+        if row is None:
+            db.add(database.TreatmentPlan(
+                disease_name=disease_name,
+                severity_bucket=bucket_label,
+                language=language,
+                generator=generator_name,
+                plan=plan,
+            ))
+        else:
+            row.plan = plan
+            row.created_at = datetime.datetime.utcnow()
+        db.commit()
+    except SQLAlchemyError as e:
+        # Most likely another worker stored the same plan first; it is safe to skip
+        db.rollback()
+        print(f"Could not store treatment plan. Error: {e}")
+    finally:
+        db.close()
+
+
+def _not_configured_message(disease_name: str, language: str) -> str:
+    return f"Gemini API not configured. Placeholder plan for {disease_name} in {language}."
+
+
+def get_treatment_plan(disease_name: str, severity: float, language: str) -> str:
+    """Returns a cached treatment plan, generating and storing it on a miss."""
+    generator = get_generator()
+    if not generator.available():
+        return _not_configured_message(disease_name, language)
+
+    bucket = severity_bucket(severity)
+    key = plan_key(generator, disease_name, bucket, language)
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        return plan
+
+    plan = _load_plan(key)
+    if plan is None:
+        try:
+            plan = generator.generate(disease_name, bucket, language)
+        except Exception as e:
+            return f"Error generating plan for {disease_name} in {language}. Error: {e}"
+        _save_plan(key, plan)
+    _plan_cache.put(key, plan)
+    return plan
+
+
+async def get_treatment_plan_async(disease_name: str, severity: float, language: str) -> str:
+    """
+    Non-blocking get_treatment_plan. Concurrent requests for the same plan wait on a
+    single upstream generation, which is bounded by TREATMENT_TIMEOUT_SECONDS.
+    """
+    generator = get_generator()
+    if not await asyncio.to_thread(generator.available):
+        return _not_configured_message(disease_name, language)
+
+    bucket = severity_bucket(severity)
+    key = plan_key(generator, disease_name, bucket, language)
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        return plan
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_plan(generator, key, disease_name, bucket, language))
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_finish_inflight, key))
+    # Shield the shared task so one client disconnecting does not cancel it for the others
+    try:
+        return await asyncio.shield(task)
+    except _PlanFailed as e:
+        return str(e)
+
+
+def _finish_inflight(key: tuple, task: asyncio.Future):
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # Mark a failure as seen even if every waiter has gone away
+
+
+class _PlanFailed(Exception):
+    """A shared generation failed; the message is the error text shown in place of the plan."""
+
+
+async def _fetch_plan(generator, key: tuple, disease_name: str, bucket: tuple, language: str) -> str:
+    plan = await asyncio.to_thread(_load_plan, key)
+    if plan is None:
+        try:
+            plan = await asyncio.wait_for(
+                asyncio.to_thread(generator.generate, disease_name, bucket, language),
+                TREATMENT_TIMEOUT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            raise _PlanFailed(f"Error generating plan for {disease_name} in {language}. Error: timed out after {TREATMENT_TIMEOUT_SECONDS:.0f}s")
+        except Exception as e:
+            raise _PlanFailed(f"Error generating plan for {disease_name} in {language}. Error: {e}")
+        await asyncio.to_thread(_save_plan, key, plan)
+    _plan_cache.put(key, plan)
+    return plan
+
+
+# --- Streaming ---
+class _StreamClosed(Exception):
+    pass
+
+
+class TreatmentStreamError(Exception):
+    """The plan could not be generated completely; chunks already sent are only partial."""
+
+
+def split_plan(plan: str, size: int = TREATMENT_STREAM_CHUNK_CHARS):
+    """Splits a finished plan into chunks of roughly `size` characters on line boundaries."""
+    chunk = ""
+    for line in plan.splitlines(keepends=True):
+        chunk += line
+        if len(chunk) >= size:
+            yield chunk
+            chunk = ""
+    if chunk:
+        yield chunk
+
+
+async def stream_treatment_plan(disease_name: str, severity: float, language: str):
+    """
+    Async generator of plan chunks. A cached plan is replayed straight away; otherwise
+    the generator's output is forwarded as it arrives and stored once complete.
+    Raises asyncio.TimeoutError if the stream runs past TREATMENT_STREAM_MAX_SECONDS,
+    and TreatmentStreamError if the generator fails or the plan grows too long.
+    """
+    generator = get_generator()
+    if not await asyncio.to_thread(generator.available):
+        yield _not_configured_message(disease_name, language)
+        return
+
+    bucket = severity_bucket(severity)
+    key = plan_key(generator, disease_name, bucket, language)
+    plan = _plan_cache.get(key)
+    if plan is None and key in _inflight:
+        # Someone is already generating this plan without streaming; wait for theirs
+        try:
+            plan = await asyncio.shield(_inflight[key])
+        except _PlanFailed as e:
+            raise TreatmentStreamError(str(e)) from e
+    if plan is None:
+        plan = await asyncio.to_thread(_load_plan, key)
+        if plan is not None:
+            _plan_cache.put(key, plan)
+    if plan is not None:
+        for chunk in split_plan(plan):
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + TREATMENT_STREAM_MAX_SECONDS
+    queue = asyncio.Queue()
+    # Bounds how many chunks the generator thread may run ahead of the client
+    slots = threading.Semaphore(TREATMENT_STREAM_BUFFER)
+    closed = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for chunk in generator.stream(disease_name, bucket, language):
+                while not slots.acquire(timeout=0.5):
+                    if closed.is_set():
+                        raise _StreamClosed()
+                if closed.is_set():
+                    raise _StreamClosed()
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except _StreamClosed:
+            pass
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    producer = loop.run_in_executor(None, produce)
+    parts = []
+    length = 0
+    try:
+        while True:
+            item = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise TreatmentStreamError(f"Error generating plan for {disease_name} in {language}. Error: {item}")
+            slots.release()
+            length += len(item)
+            if length > TREATMENT_STREAM_MAX_CHARS:
+                raise TreatmentStreamError(
+                    f"Error generating plan for {disease_name} in {language}. Error: plan exceeded {TREATMENT_STREAM_MAX_CHARS} characters"
+                )
+            parts.append(item)
+            yield item
+    finally:
+        closed.set()
+
+    await producer
+    plan = "".join(parts)
+    _plan_cache.put(key, plan)
+    await asyncio.to_thread(_save_plan, key, plan)
+
+
+def cache_stats() -> dict:
+    stats = _plan_cache.stats()
+    stats["in_flight"] = len(_inflight)
+    return stats
@@ -0,0 +1,28 @@
+# benchmarks/__init__.py
+"""
+Reproducible benchmarks for the inference, severity, economics and auth code paths
+and an in-process load test of the API.
+
+    python -m benchmarks run --output results/abc123.json
+    python -m benchmarks compare results/base.json results/abc123.json
+
+Everything runs locally: the database is a throwaway SQLite file and Gemini is
+replaced by a stub with a fixed latency, so results only depend on this machine.
+"""
+import os
+import tempfile
+
+
+def configure_environment(workdir: str = None, database_url: str = None) -> str:
+    """
+    Points the app at a throwaway SQLite database (or `database_url`, if given) and
+    turns off the result caches that would otherwise turn repeated benchmark images
+    into cache hits. Must run before any `app` module is imported. DATABASE_URL from
+    the environment is ignored, so a benchmark run never writes into a real database;
+    the cache settings can still be overridden.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="agro-bench-")
+    os.environ["DATABASE_URL"] = database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("ANALYSIS_CACHE_MAX_ENTRIES", "0")
+    os.environ.setdefault("ANALYSIS_CACHE_PHASH_DISTANCE", "-1")
+    return workdir
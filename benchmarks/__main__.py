@@ -0,0 +1,133 @@
+# benchmarks/__main__.py
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+from benchmarks import configure_environment
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# Metrics where a higher value is better; for everything else (latencies) lower is better
+HIGHER_IS_BETTER = ("throughput_per_s",)
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_per_s")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args):
+    configure_environment(database_url=args.database_url)
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)  # main.py and the model paths are resolved relative to the repo root
+
+    from app import prediction_service
+
+    log = (lambda *a: None) if args.quiet else (lambda *a: print(*a, file=sys.stderr))
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "inference_backend": prediction_service.INFERENCE_BACKEND,
+        "config": {k: v for k, v in vars(args).items() if k not in ("func", "output", "quiet")},
+    }
+
+    if "micro" in args.suites:
+        from benchmarks import micro
+
+        log("Microbenchmarks")
+        report["micro"] = micro.run(args.resolutions, args.images, args.iterations, log)
+    if "load" in args.suites:
+        from benchmarks import load
+
+        log("Load test")
+        report["load"] = load.run(
+            args.scenarios, args.requests, args.concurrency, args.resolutions[0], args.images,
+            args.gemini_latency_ms, log,
+        )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text)
+        log(f"Wrote {args.output}")
+    else:
+        print(text)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline {baseline.get('commit')} vs candidate {candidate.get('commit')}")
+    regressions = 0
+    for suite in ("micro", "load"):
+        for name, after in candidate.get(suite, {}).items():
+            before = baseline.get(suite, {}).get(name)
+            if not before:
+                continue
+            for metric in COMPARED_METRICS:
+                if not before.get(metric) or metric not in after:
+                    continue
+                change = (after[metric] - before[metric]) / before[metric] * 100
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                flag = ""
+                if worse > args.threshold:
+                    flag = "  REGRESSION"
+                    regressions += 1
+                elif -worse > args.threshold:
+                    flag = "  improved"
+                print(f"{suite}/{name:<45} {metric:<17} {before[metric]:>12.3f} -> {after[metric]:>12.3f} ({change:+.1f}%){flag}")
+
+    print(f"{regressions} regression(s) beyond {args.threshold}%")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    from benchmarks.load import SCENARIOS
+    from benchmarks.synthetic import PHONE_RESOLUTIONS
+
+    scenario_names = list(SCENARIOS)
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run the benchmarks and write a JSON report")
+    p_run.add_argument("--suites", nargs="+", choices=["micro", "load"], default=["micro", "load"])
+    p_run.add_argument("--resolutions", nargs="+", choices=list(PHONE_RESOLUTIONS), default=["12mp"],
+                       help="Image sizes for the microbenchmarks; the load test uses the first")
+    p_run.add_argument("--images", type=int, default=8, help="Distinct synthetic images per resolution")
+    p_run.add_argument("--iterations", type=int, default=30, help="Calls per microbenchmark (x100 for the cheap ones)")
+    p_run.add_argument("--scenarios", nargs="+", choices=scenario_names, default=scenario_names)
+    p_run.add_argument("--requests", type=int, default=200, help="Requests per load scenario (fewer for the heavy ones)")
+    p_run.add_argument("--concurrency", type=int, default=8)
+    p_run.add_argument("--gemini-latency-ms", type=float, default=1500, help="Latency of the stubbed Gemini client")
+    p_run.add_argument("--database-url", help="Benchmark against this database instead of a throwaway SQLite file")
+    p_run.add_argument("--output", help="Write the report here instead of stdout")
+    p_run.add_argument("--quiet", action="store_true")
+    p_run.set_defaults(func=run)
+
+    p_compare = sub.add_parser("compare", help="Compare two reports; exits 1 on regressions")
+    p_compare.add_argument("baseline")
+    p_compare.add_argument("candidate")
+    p_compare.add_argument("--threshold", type=float, default=10.0, help="Percent change counted as a regression")
+    p_compare.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# benchmarks/load.py
+"""
+In-process load test: drives the FastAPI app through httpx's ASGI transport with
+a fixed number of concurrent clients per scenario, so no server or network is involved.
+"""
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+
+from benchmarks.stats import summarize
+from benchmarks.synthetic import image_set
+
+BENCH_USER = {"username": "bench", "email": "bench@example.com", "name": "Bench", "password": "benchmark-password"}
+# Diagnosis logs inserted before the read-heavy scenarios run
+SEED_LOGS = 5000
+
+
+def _stub_gemini(latency_seconds: float):
+    """Stands in for the Gemini client: the local plan, after a fixed upstream latency."""
+    from app import treatment_service
+
+    class StubGeminiGenerator(treatment_service.LocalGenerator):
+        name = "gemini-stub"
+
+        def generate(self, disease_name: str, bucket: tuple, language: str) -> str:
+            time.sleep(latency_seconds)
+            return super().generate(disease_name, bucket, language)
+
+    treatment_service.set_generator(StubGeminiGenerator())
+
+
+# --- Scenarios ---
+# Each takes (client, request number, shared context) and returns the response.
+
+async def _analyze_plant(client, i, ctx):
+    image = ctx["images"][i % len(ctx["images"])]
+    return await client.post("/analyze-plant/", files={"file": ("leaf.jpg", image, "image/jpeg")})
+
+
+async def _login(client, i, ctx):
+    data = {"username": BENCH_USER["username"], "password": BENCH_USER["password"]}
+    return await client.post("/token", data=data)
+
+
+async def _users_me(client, i, ctx):
+    return await client.get("/users/me/", headers=ctx["auth"])
+
+
+async def _log_diagnosis(client, i, ctx):
+    rng = ctx["rng"]
+    body = {
+        "disease_name": rng.choice(ctx["diseases"]),
+        "severity": rng.uniform(0, 100),
+        "latitude": rng.uniform(8, 35),
+        "longitude": rng.uniform(68, 97),
+    }
+    return await client.post("/log-diagnosis/", json=body, headers=ctx["auth"])
+
+
+async def _history(client, i, ctx):
+    return await client.get("/history/me/", params={"limit": 50}, headers=ctx["auth"])
+
+
+async def _hotspot_cells(client, i, ctx):
+    return await client.get("/get-hotspots/cells/", params={"zoom": 6})
+
+
+async def _trends(client, i, ctx):
+    return await client.get("/trends/")
+
+
+async def _get_treatment(client, i, ctx):
+    disease = ctx["diseases"][i % len(ctx["diseases"])]
+    return await client.get("/get-treatment/", params={"disease_name": disease, "severity": (i * 7) % 100})
+
+
+async def _calculate_impact(client, i, ctx):
+    disease = ctx["diseases"][i % len(ctx["diseases"])]
+    return await client.get("/calculate-impact/", params={"disease_name": disease, "severity": (i * 7) % 100})
+
+
+# name -> (scenario, share of --requests it runs)
+SCENARIOS = {
+    "analyze_plant": (_analyze_plant, 0.5),
+    "login": (_login, 0.25),
+    "users_me": (_users_me, 1.0),
+    "log_diagnosis": (_log_diagnosis, 1.0),
+    "history": (_history, 1.0),
+    "hotspot_cells": (_hotspot_cells, 0.5),
+    "trends": (_trends, 1.0),
+    "get_treatment": (_get_treatment, 1.0),
+    "calculate_impact": (_calculate_impact, 1.0),
+}
+
+
+async def _run_scenario(client, scenario, requests: int, concurrency: int, ctx) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            t0 = time.perf_counter()
+            try:
+                response = await scenario(client, i, ctx)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def _setup(client, ctx):
+    response = await client.post("/users/", json=BENCH_USER)
+    if response.status_code not in (200, 400):  # 400: already registered on a reused database
+        raise RuntimeError(f"Could not create the benchmark user: {response.text}")
+    response = await client.post("/token", data={"username": BENCH_USER["username"], "password": BENCH_USER["password"]})
+    response.raise_for_status()
+    ctx["auth"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    rng = ctx["rng"]
+    now = datetime.utcnow()
+    for offset in range(0, SEED_LOGS, 1000):
+        records = [
+            {
+                "client_id": f"seed-{offset + n}",
+                "disease_name": rng.choice(ctx["diseases"]),
+                "severity": rng.uniform(0, 100),
+                "latitude": rng.uniform(8, 35),
+                "longitude": rng.uniform(68, 97),
+                "recorded_at": (now - timedelta(hours=rng.uniform(0, 24 * 6))).isoformat(),
+            }
+            for n in range(1000)
+        ]
+        (await client.post("/log-diagnosis/bulk/", json={"records": records}, headers=ctx["auth"])).raise_for_status()
+
+
+async def _run(scenarios: list, requests: int, concurrency: int, resolution: str, images: int,
+               gemini_latency_ms: float, log) -> dict:
+    import main
+    from app import health_service, prediction_service
+
+    _stub_gemini(gemini_latency_ms / 1000)
+    ctx = {
+        "rng": random.Random(0),
+        "diseases": list(prediction_service.index_to_class.values()),
+    }
+    if "analyze_plant" in scenarios:
+        log(f"  generating {images} {resolution} images")
+        ctx["images"] = image_set(resolution, images)
+
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        while not health_service.is_ready():
+            await asyncio.sleep(0.2)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await _setup(client, ctx)
+            for name in scenarios:
+                scenario, share = SCENARIOS[name]
+                count = max(concurrency, int(requests * share))
+                log(f"  {name}: {count} requests, {concurrency} concurrent")
+                results[name] = await _run_scenario(client, scenario, count, concurrency, ctx)
+    return results
+
+
+def run(scenarios: list, requests: int, concurrency: int, resolution: str, images: int,
+        gemini_latency_ms: float, log=print) -> dict:
+    return asyncio.run(_run(scenarios, requests, concurrency, resolution, images, gemini_latency_ms, log))
@@ -0,0 +1,59 @@
+# benchmarks/micro.py
+"""Single-threaded microbenchmarks of the service functions behind the endpoints."""
+import random
+
+from benchmarks.stats import measure
+from benchmarks.synthetic import image_set
+
+
+def _full_pipeline(image_bytes: bytes):
+    from app import prediction_service, preprocessing_service, severity_service
+
+    image = preprocessing_service.prepare_image(image_bytes)
+    result = prediction_service.predict_disease(image)
+    severity_service.analyze_severity(image, result["disease_name"])
+
+
+def run(resolutions: list, images: int, iterations: int, log=print) -> dict:
+    from app import auth, economic_service, prediction_service, preprocessing_service, severity_service
+
+    results = {}
+    prediction_service.warmup()
+
+    for resolution in resolutions:
+        log(f"  generating {images} {resolution} images")
+        jpegs = image_set(resolution, images)
+        prepared = [preprocessing_service.prepare_image(data) for data in jpegs]
+        calls = max(iterations, len(jpegs))
+        pick = lambda items: [(items[i % len(items)],) for i in range(calls)]  # noqa: E731
+
+        log(f"  {resolution}: prepare_image / predict_disease / analyze_severity")
+        results[f"prepare_image[{resolution}]"] = measure(preprocessing_service.prepare_image, pick(jpegs))
+        results[f"predict_disease[{resolution}]"] = measure(prediction_service.predict_disease, pick(prepared))
+        results[f"analyze_severity[{resolution}]"] = measure(severity_service.analyze_severity, pick(prepared))
+        results[f"analyze_severity_batch[{resolution}x{len(prepared)}]"] = measure(
+            severity_service.analyze_severity_batch, [(prepared,)] * iterations
+        )
+        # The whole single-image path from upload bytes, as /analyze-plant/ does it without the cache
+        results[f"full_pipeline[{resolution}]"] = measure(_full_pipeline, pick(jpegs))
+
+    log("  calculate_economic_impact")
+    rng = random.Random(0)
+    diseases = list(prediction_service.index_to_class.values())
+    regions = [None] + economic_service.get_index().regions
+    impact_args = [(rng.choice(diseases), rng.uniform(0, 100), rng.choice(regions)) for _ in range(iterations * 100)]
+    results["calculate_economic_impact"] = measure(economic_service.calculate_economic_impact, impact_args)
+    results["calculate_economic_impact_batch[1000]"] = measure(
+        economic_service.calculate_economic_impact_batch,
+        [(impact_args[i:i + 1000],) for i in range(0, len(impact_args), 1000)],
+    )
+
+    log("  auth helpers")
+    hashed = auth.get_password_hash("benchmark-password")
+    results["get_password_hash"] = measure(auth.get_password_hash, [("benchmark-password",)] * iterations)
+    results["verify_password"] = measure(auth.verify_password, [("benchmark-password", hashed)] * iterations)
+    token = auth.create_access_token({"sub": "benchmark"})
+    results["create_access_token"] = measure(auth.create_access_token, [({"sub": "benchmark"},)] * iterations * 100)
+    results["decode_token"] = measure(auth._decode_token, [(token,)] * iterations * 100)
+
+    return results
@@ -0,0 +1,38 @@
+# benchmarks/stats.py
+import time
+import numpy as np
+
+
+def summarize(latencies: list, elapsed: float = None, errors: int = 0) -> dict:
+    """Latency percentiles in milliseconds and throughput in operations per second."""
+    samples = np.asarray(latencies, dtype=np.float64) * 1000
+    if elapsed is None:
+        elapsed = samples.sum() / 1000
+    result = {
+        "count": len(samples),
+        "errors": errors,
+        "throughput_per_s": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+    }
+    if len(samples):
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        result.update({
+            "mean_ms": round(float(samples.mean()), 3),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(float(samples.max()), 3),
+        })
+    return result
+
+
+def measure(func, args_list: list, warmup: int = 3) -> dict:
+    """Calls func(*args) for every entry of args_list, one at a time, after a few warmup calls."""
+    for args in args_list[:warmup]:
+        func(*args)
+    latencies = []
+    start = time.perf_counter()
+    for args in args_list:
+        t0 = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
@@ -0,0 +1,51 @@
+# benchmarks/synthetic.py
+"""Synthetic leaf photos, so benchmarks don't depend on a private image set."""
+import io
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# Typical phone camera outputs (width, height)
+PHONE_RESOLUTIONS = {
+    "12mp": (4032, 3024),
+    "8mp": (3264, 2448),
+    "fhd": (1920, 1080),
+}
+
+
+def make_leaf_image(width: int, height: int, seed: int = 0, lesions: int = 12) -> Image.Image:
+    """
+    A leaf-like green ellipse with brown/yellow lesions on a textured soil background.
+    The same seed always gives the same image.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Low-frequency noise upscaled to full size keeps generation fast at 12MP
+    noise = rng.integers(0, 40, size=(height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    background = Image.fromarray(noise + np.array([90, 70, 50], dtype=np.uint8)).resize((width, height))
+    draw = ImageDraw.Draw(background)
+
+    cx, cy = width / 2 + rng.uniform(-0.05, 0.05) * width, height / 2 + rng.uniform(-0.05, 0.05) * height
+    rx, ry = width * rng.uniform(0.3, 0.42), height * rng.uniform(0.3, 0.42)
+    green = tuple(int(v) for v in rng.integers([40, 120, 30], [80, 180, 70]))
+    draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], fill=green)
+
+    for _ in range(lesions):
+        angle, dist = rng.uniform(0, 2 * np.pi), rng.uniform(0, 0.8)
+        x, y = cx + np.cos(angle) * rx * dist, cy + np.sin(angle) * ry * dist
+        r = min(width, height) * rng.uniform(0.01, 0.05)
+        color = tuple(int(v) for v in rng.integers([140, 90, 20], [200, 150, 60]))
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=color)
+
+    return background.filter(ImageFilter.GaussianBlur(radius=2))
+
+
+def make_leaf_jpeg(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    make_leaf_image(width, height, seed).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def image_set(resolution: str, count: int, seed: int = 0) -> list:
+    """`count` distinct JPEGs at one of PHONE_RESOLUTIONS."""
+    width, height = PHONE_RESOLUTIONS[resolution]
+    return [make_leaf_jpeg(width, height, seed + i) for i in range(count)]
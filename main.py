@@ -1,25 +1,56 @@
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, status, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, status, BackgroundTasks, Query, Response, Request
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional, Literal, Union
+from contextlib import asynccontextmanager
+import asyncio
 from app import economic_service
 # We removed BaseModel from here because it's now in schemas.py
 from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
 
 import traceback
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+import json
+import zipfile
+import threading
+import functools
 import random
-from app.database import otp_store
 import os
 # Import services, database components, AND the new schemas
-from app import prediction_service, severity_service, treatment_service, database, schemas, auth
+from app import prediction_service, treatment_service, database, schemas, auth, executor_service, analysis_service, cache_service, health_service, hotspot_service, rollup_service, pagination, sync_service, otp_service, metrics_service, admission_service, export_service
 
-# This line remains the same
-database.create_db_and_tables()
 
-app = FastAPI(title="AgroDoctor API", description="API for Plant Disease Prediction and Analysis")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create tables and load/warm the model in the background so the API can
+    # start accepting connections immediately; /health/ready reports progress.
+    init_task = asyncio.create_task(health_service.initialize())
+    otp_sweeper = asyncio.create_task(otp_service.sweep_forever())
+    yield
+    init_task.cancel()
+    otp_sweeper.cancel()
+    # Stop the batching worker and the CPU pools so the process exits cleanly
+    prediction_service.shutdown()
+    executor_service.shutdown()
+    await database.dispose_async_engine()
+
+
+# Most items accepted by one /calculate-impact/batch/ call
+MAX_IMPACT_BATCH = int(os.getenv("MAX_IMPACT_BATCH", 50000))
+
+app = FastAPI(title="AgroDoctor API", description="API for Plant Disease Prediction and Analysis", lifespan=lifespan)
+# Added first so it sits closest to the routes; rejects uploads before their body is read
+app.add_middleware(
+    admission_service.AdmissionMiddleware,
+    paths={
+        "/analyze-plant/": admission_service.inference_admission,
+        "/analyze-plant/batch/": admission_service.inference_admission,
+    },
+)
 # --- ADD THIS CORS MIDDLEWARE SECTION ---
 # This allows your frontend (running on any port) to communicate with your backend.
 origins = ["*"]  # For development, allow all origins.
@@ -30,7 +61,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # Allow all methods
     allow_headers=["*"], # Allow all headers
+    expose_headers=[pagination.NEXT_CURSOR_HEADER],  # Let browser clients read the paging cursor
 )
+# Request counts and latency for /metrics, plus Server-Timing headers when enabled
+app.add_middleware(metrics_service.MetricsMiddleware, fastapi_app=app)
 
 # --- NEW: Mail Sending Configuration ---
 conf = None
@@ -76,14 +110,36 @@ async def submit_feedback(feedback_data: FeedbackCreate, db: Session = Depends(g
 # --- API Endpoints ---
 # --- AUTHENTICATION ENDPOINTS ---
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = auth.get_user(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    # Reserve the attempt before hashing, so concurrent guesses count against the limit at once
+    retry_after = auth.login_limiter.reserve(form_data.username)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts",
+            headers={"Retry-After": str(retry_after)},
+        )
+    try:
+        user = await auth.get_user_async(db, username=form_data.username)
+        valid, new_hash = False, None
+        if user:
+            valid, new_hash = await auth.verify_password_async(form_data.password, user.hashed_password)
+    except BaseException:
+        # e.g. the hashing pool is saturated (503): the attempt was never judged
+        auth.login_limiter.release(form_data.username)
+        raise
+    if not valid:
+        auth.login_limiter.record_failure(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    auth.login_limiter.reset(form_data.username)
+    if new_hash:
+        # Hash parameters changed since this password was set; store the upgraded hash
+        user.hashed_password = new_hash
+        await db.commit()
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -91,17 +147,18 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user_by_username = auth.get_user(db, username=user.username)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    db_user_by_username = await auth.get_user_async(db, username=user.username)
     if db_user_by_username:
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Check for existing email
-    db_user_by_email = db.query(database.User).filter(database.User.email == user.email).first()
-    if db_user_by_email:
+    result = await db.execute(select(database.User.id).where(database.User.email == user.email).limit(1))
+    if result.first():
         raise HTTPException(status_code=400, detail="Email already registered")
         
-    hashed_password = auth.get_password_hash(user.password)
+    # Hashed in the hashing pool so the event loop keeps serving other requests meanwhile
+    hashed_password = await auth.get_password_hash_async(user.password)
     db_user = database.User(
         username=user.username, 
         hashed_password=hashed_password,
@@ -109,8 +166,8 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
         name=user.name
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 # --- NEW: Password Recovery Endpoints ---
@@ -140,13 +197,14 @@ async def recover_password(email: str, background_tasks: BackgroundTasks, db: Se
     return {"message": "Password recovery email sent"}
 
 @app.post("/reset-password/")
-async def reset_password(token: str, new_password: str, db: Session = Depends(database.get_db)):
-    user = await auth.get_current_user(token=token, db=db)
+async def reset_password(token: str, new_password: str, db: AsyncSession = Depends(database.get_async_db)):
+    user = await auth.get_user_from_token_async(token, db)
     if not user:
         raise HTTPException(status_code=400, detail="Invalid token")
     
-    user.hashed_password = auth.get_password_hash(new_password)
-    db.commit()
+    user.hashed_password = await auth.get_password_hash_async(new_password)
+    await db.commit()
+    auth.invalidate_user(user.username)
     return {"message": "Password updated successfully"}
 # --- END NEW ---
 
@@ -157,16 +215,137 @@ async def read_users_me(current_user: schemas.User = Depends(auth.get_current_us
 
 
 @app.post("/analyze-plant/")
-async def analyze_plant_image(file: UploadFile = File(...)):
-    image_bytes = await file.read()
-    result = prediction_service.predict_disease(image_bytes)
-    severity = severity_service.analyze_severity(image_bytes)
+async def analyze_plant_image(request: Request, file: UploadFile = File(...)):
+    # Uploads arriving while the queue is full were already shed by AdmissionMiddleware,
+    # before their body was read; the rest wait here for a slot before any image work
+    async with admission_service.inference_admission.admit(request.is_disconnected):
+        with metrics_service.timed("upload_read"):
+            image_bytes = await file.read()
+        analysis = await analysis_service.analyze_image(image_bytes)
+
+    with metrics_service.timed("encode"):
+        return JSONResponse(analysis_service.format_analysis(analysis))
 
+
+@app.post("/analyze-plant/batch/", summary="Analyze many leaf images of one field")
+async def analyze_plant_batch(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Accepts many images, a zip archive of images, or both. Streams NDJSON: one line per
+    image as it finishes (with its index and filename), then a final line with a
+    field-level summary. Images that got no analysis slot before the batch deadline are
+    marked `skipped`; the summary then has `complete: false`.
+    """
+    sources = _batch_sources(files)
+    if not sources:
+        raise HTTPException(status_code=400, detail="No images found in the upload")
+    if len(sources) > analysis_service.MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {analysis_service.MAX_BATCH_IMAGES} images per request")
+
+    async def lines():
+        analyses = []
+        failed = skipped = 0
+        async for result in analysis_service.analyze_sources(
+            sources, admission=admission_service.inference_admission, is_disconnected=request.is_disconnected
+        ):
+            analysis = result.pop("_analysis", None)
+            if analysis is not None:
+                analyses.append(analysis)
+            elif result.get("skipped"):
+                skipped += 1
+            else:
+                failed += 1
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": analysis_service.summarize_field(analyses, failed, skipped)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+BATCH_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def _batch_sources(files: List[UploadFile]) -> list:
+    """
+    (filename, load) pairs for every image in the upload. Nothing is read yet:
+    uploads stay in Starlette's spooled temp files and zip members are read one at
+    a time when their turn comes.
+    """
+    sources = []
+    for upload in files:
+        name = upload.filename or ""
+        if name.lower().endswith(".zip") or upload.content_type in ("application/zip", "application/x-zip-compressed"):
+            try:
+                archive = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"{name} is not a valid zip archive")
+            # ZipFile reads through one shared file object, so reads must not overlap
+            lock = threading.Lock()
+            for info in archive.infolist():
+                if info.is_dir() or info.filename.startswith("__MACOSX/") or not info.filename.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                    continue
+                sources.append((info.filename, functools.partial(_read_zip_member, archive, info, lock)))
+        else:
+            sources.append((name, functools.partial(_read_upload, upload)))
+    return sources
+
+
+def _read_upload(upload: UploadFile) -> bytes:
+    upload.file.seek(0)
+    # Read one byte past the limit so oversized uploads are detected without reading them whole
+    return upload.file.read(analysis_service.MAX_BATCH_IMAGE_BYTES + 1)
+
+
+def _read_zip_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, lock: threading.Lock) -> bytes:
+    if info.file_size > analysis_service.MAX_BATCH_IMAGE_BYTES:
+        raise ValueError(f"image larger than {analysis_service.MAX_BATCH_IMAGE_BYTES} bytes")
+    with lock:
+        with archive.open(info) as member:
+            return member.read(analysis_service.MAX_BATCH_IMAGE_BYTES + 1)
+
+
+def _all_cache_stats() -> dict:
     return {
-        "disease_name": result["disease_name"],
-        "confidence": f"{result['confidence']:.2%}",
-        "severity_percentage": f"{severity:.2f}%"
+        "analysis": cache_service.analysis_cache.stats(),
+        "treatment_plans": treatment_service.cache_stats(),
+        "principals": auth.principal_cache_stats(),
+    }
+
+
+@app.get("/cache-stats/", summary="Hit/miss counters for the in-process caches")
+async def cache_stats():
+    return _all_cache_stats()
+
+
+@metrics_service.register_collector
+def _cache_metrics():
+    samples = []
+    for cache, stats in (_all_cache_stats()).items():
+        labels = {"cache": cache}
+        samples.append(("agro_cache_hit_ratio", "Share of cache lookups that were hits.", labels, stats["hit_ratio"]))
+        samples.append(("agro_cache_hits", "Cache hits since startup.", labels, stats["hits"]))
+        samples.append(("agro_cache_misses", "Cache misses since startup.", labels, stats["misses"]))
+        samples.append(("agro_cache_entries", "Entries currently cached.", labels, stats["entries"]))
+    return samples
+
+
+@app.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(metrics_service.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health/live", summary="Liveness probe")
+async def liveness():
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", summary="Readiness probe with per-component status")
+async def readiness():
+    ready = health_service.is_ready()
+    body = {
+        "status": "ready" if ready else "starting",
+        "components": health_service.component_status(),
+        "errors": health_service.init_errors,
     }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
 
 
 @app.get("/get-treatment/", summary="Get treatment plan for a disease")
@@ -174,13 +353,37 @@ async def get_treatment(disease_name: str, severity: float, language: str = "Eng
     """
     Generates a treatment plan from the Gemini API based on the disease name and its severity.
     """
-    # Now we pass the severity to the service function
-    plan = treatment_service.get_treatment_plan(disease_name, severity, language)
+    # Plans are cached per severity bucket and generated without blocking the event loop
+    plan = await treatment_service.get_treatment_plan_async(disease_name, severity, language)
     return {"treatment_plan": plan}
+
+
+@app.get("/get-treatment/stream/", summary="Stream a treatment plan as Server-Sent Events")
+async def stream_treatment(disease_name: str, severity: float, language: str = "English"):
+    """
+    Same plan as /get-treatment/, sent as SSE `data:` events while it is generated,
+    followed by a final `done` event, or an `error` event if generation fails part way
+    (the chunks sent before it are then incomplete). A cached plan is streamed back immediately.
+    """
+    async def events():
+        try:
+            async for chunk in treatment_service.stream_treatment_plan(disease_name, severity, language):
+                yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except asyncio.TimeoutError:
+            yield f"event: error\ndata: {json.dumps({'detail': 'Treatment plan generation timed out'})}\n\n"
+        except treatment_service.TreatmentStreamError as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 # --- UPDATED MAPPING ENDPOINTS ---
 
 @app.post("/log-diagnosis/", summary="Log a diagnosis for a user")
-async def log_diagnosis(log: schemas.DiagnosisLogCreate, db: Session = Depends(database.get_db), current_user: schemas.User = Depends(auth.get_current_user)):
+async def log_diagnosis(log: schemas.DiagnosisLogCreate, db: AsyncSession = Depends(database.get_async_db), current_user: schemas.User = Depends(auth.get_current_user)):
     db_log = database.DiagnosisLog(
         disease_name=log.disease_name,
         severity=log.severity,
@@ -190,33 +393,183 @@ async def log_diagnosis(log: schemas.DiagnosisLogCreate, db: Session = Depends(d
         owner_id=current_user.id
     )
     db.add(db_log)
-    db.commit()
-    db.refresh(db_log)
+    # Keep the hotspot/trend rollups in step, in the same transaction as the log
+    await db.run_sync(rollup_service.record_diagnoses, [db_log])
+    await db.commit()
     return {"status": "success", "log_id": db_log.id}
 
 
-@app.get("/get-hotspots/", summary="Get disease hotspots from the last 7 days", response_model=List[schemas.DiagnosisLog])
-# THIS IS THE LINE THAT FIXES THE ERROR.
-# We changed database.DiagnosisLog to schemas.DiagnosisLog
-async def get_hotspots(db: Session = Depends(database.get_db)):
+@app.post("/log-diagnosis/bulk/", summary="Sync a batch of offline diagnoses", response_model=List[schemas.DiagnosisSyncResult])
+def log_diagnosis_bulk(batch: schemas.DiagnosisLogBulkCreate, db: Session = Depends(database.get_db), current_user: schemas.User = Depends(auth.get_current_user)):
+    """
+    Stores up to MAX_SYNC_BATCH records in a single transaction. Each record carries a
+    client_id; records already synced are reported as duplicates, so a sync that was
+    interrupted can simply be sent again.
+    """
+    if len(batch.records) > sync_service.MAX_SYNC_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {sync_service.MAX_SYNC_BATCH} records per request")
+    return sync_service.ingest_diagnoses(db, current_user.id, batch.records)
+
+
+@app.get(
+    "/get-hotspots/",
+    summary="Get disease hotspots from the last 7 days",
+    response_model=Union[List[schemas.HotspotCell], List[schemas.DiagnosisLog]],
+)
+async def get_hotspots(
+    min_lat: Optional[float] = None,
+    min_lon: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lon: Optional[float] = None,
+    disease_name: Optional[str] = None,
+    zoom: int = Query(8, ge=0, le=hotspot_service.MAX_ZOOM, description="Web-map zoom level; sets the grid resolution"),
+    raw: bool = Query(False, description="Return individual diagnoses instead of grid cells (older clients)"),
+    limit: int = Query(hotspot_service.MAX_RAW_ROWS, ge=1, le=hotspot_service.MAX_RAW_ROWS, description="Most rows returned with raw=true"),
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Hotspots aggregated into map grid cells, as /get-hotspots/cells/ with days=7.
+    `raw=true` returns the individual diagnoses instead, newest first and at most `limit`.
+    """
+    bbox = _parse_bbox(min_lat, min_lon, max_lat, max_lon)
     time_threshold = datetime.utcnow() - timedelta(days=7)
-    hotspots = db.query(database.DiagnosisLog).filter(database.DiagnosisLog.timestamp >= time_threshold).all()
-    return hotspots
+    if not raw:
+        return await _hotspot_cells(db, time_threshold, zoom, bbox, disease_name)
+
+    Log = database.DiagnosisLog
+    query = select(Log).where(Log.timestamp >= time_threshold)
+    if bbox is not None:
+        query = query.where(
+            Log.latitude.between(bbox[0], bbox[2]),
+            Log.longitude.between(bbox[1], bbox[3]),
+        )
+    if disease_name:
+        query = query.where(Log.disease_name == disease_name)
+    query = query.order_by(Log.timestamp.desc(), Log.id.desc()).limit(limit)
+    return (await db.execute(query)).scalars().all()
+
+
+@app.get("/get-hotspots/cells/", summary="Disease hotspots aggregated into map grid cells", response_model=List[schemas.HotspotCell])
+async def get_hotspot_cells(
+    min_lat: Optional[float] = None,
+    min_lon: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lon: Optional[float] = None,
+    zoom: int = Query(8, ge=0, le=hotspot_service.MAX_ZOOM, description="Web-map zoom level; sets the grid resolution"),
+    disease_name: Optional[str] = None,
+    days: int = Query(7, ge=1, le=365),
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Counts and mean severity per grid cell inside the bounding box, instead of one
+    row per diagnosis. A map tile is split into 8 cells per side, so cells get 2x finer
+    with every zoom level, i.e. 45 / 2**zoom degrees. Cells at least ROLLUP_CELL_DEG
+    wide are served from the daily rollups (counting whole days); finer ones scan the logs.
+    """
+    bbox = _parse_bbox(min_lat, min_lon, max_lat, max_lon)
+    since = datetime.utcnow() - timedelta(days=days)
+    return await _hotspot_cells(db, since, zoom, bbox, disease_name)
+
+
+async def _hotspot_cells(db: AsyncSession, since: datetime, zoom: int, bbox, disease_name: Optional[str]):
+    return await db.run_sync(
+        hotspot_service.hotspot_cells,
+        since, hotspot_service.cell_size_for_zoom(zoom), bbox=bbox, disease_name=disease_name,
+    )
+
+
+@app.get("/trends/", summary="Daily diagnosis counts and mean severity", response_model=List[schemas.TrendPoint])
+async def get_trends(
+    disease_name: Optional[str] = None,
+    days: int = Query(30, ge=1, le=365),
+    min_lat: Optional[float] = None,
+    min_lon: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lon: Optional[float] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """Served from the pre-aggregated rollups, so cost does not grow with the raw log volume."""
+    bbox = _parse_bbox(min_lat, min_lon, max_lat, max_lon)
+    start_day = (datetime.utcnow() - timedelta(days=days - 1)).date()
+    return await db.run_sync(rollup_service.trend_series, start_day, disease_name=disease_name, bbox=bbox)
+
+
+def _parse_bbox(min_lat, min_lon, max_lat, max_lon):
+    values = (min_lat, min_lon, max_lat, max_lon)
+    if all(v is None for v in values):
+        return None
+    if any(v is None for v in values):
+        raise HTTPException(status_code=400, detail="min_lat, min_lon, max_lat and max_lon must be given together")
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="Bounding box minimums must not exceed maximums")
+    return values
 
 @app.get("/history/me/", summary="Get diagnosis history for the current user", response_model=List[schemas.DiagnosisLog])
-async def get_my_history(db: Session = Depends(database.get_db), current_user: schemas.User = Depends(auth.get_current_user)):
-    history = db.query(database.DiagnosisLog).filter(database.DiagnosisLog.owner_id == current_user.id).order_by(database.DiagnosisLog.timestamp.desc()).all()
+async def get_my_history(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Value of the X-Next-Cursor header from the previous page"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    disease_name: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    """
+    Newest first, one page at a time. When more rows exist, the response carries an
+    X-Next-Cursor header; pass it back as `cursor` to get the next page.
+    """
+    Log = database.DiagnosisLog
+    query = select(Log).where(Log.owner_id == current_user.id)
+    if start:
+        query = query.where(Log.timestamp >= database.naive_utc(start))
+    if end:
+        query = query.where(Log.timestamp < database.naive_utc(end))
+    if disease_name:
+        query = query.where(Log.disease_name == disease_name)
+    if cursor:
+        try:
+            after_timestamp, after_id = pagination.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(Log.timestamp, Log.id) < (after_timestamp, after_id))
+
+    # Fetch one extra row to learn whether there is a next page
+    query = query.order_by(Log.timestamp.desc(), Log.id.desc()).limit(limit + 1)
+    history = (await db.execute(query)).scalars().all()
+    if len(history) > limit:
+        history = history[:limit]
+        response.headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(history[-1].timestamp, history[-1].id)
     return history
 
 @app.get("/calculate-impact/", summary="Calculate potential financial impact of a disease")
-async def calculate_impact(disease_name: str, severity: float):
+async def calculate_impact(disease_name: str, severity: float, region: Optional[str] = None):
     """
     Takes disease name and severity percentage to calculate potential yield
-    and financial loss.
+    and financial loss. `region` (e.g. andhra_pradesh) selects regional prices and yields.
     """
-    impact_data = economic_service.calculate_economic_impact(disease_name, severity)
+    impact_data = economic_service.calculate_economic_impact(disease_name, severity, region)
     return impact_data
 
+
+@app.post("/calculate-impact/batch/", summary="Calculate financial impact for many diagnoses at once")
+async def calculate_impact_batch(batch: schemas.ImpactBatchRequest):
+    """
+    Per-item impact (scaled by each item's acres) plus totals, computed in one
+    vectorized pass. Meant for district-level loss dashboards.
+    """
+    if len(batch.items) > MAX_IMPACT_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_IMPACT_BATCH} items per request")
+    results = economic_service.calculate_economic_impact_batch(
+        [(item.disease_name, item.severity, item.region) for item in batch.items],
+        acres=[item.acres for item in batch.items],
+    )
+    return {
+        "results": results,
+        "total_potential_financial_loss_min": sum(r["potential_financial_loss_min"] for r in results),
+        "total_potential_financial_loss_max": sum(r["potential_financial_loss_max"] for r in results),
+    }
+
 @app.get("/view-feedbacks/")
 def read_feedbacks(db: Session = Depends(get_db)):
     feedbacks = db.query(Feedback).all()
@@ -229,6 +582,48 @@ def read_feedbacks(db: Session = Depends(get_db)):
         }
         for f in feedbacks
     ]
+
+
+# --- Streaming exports ---
+
+@app.get("/export/feedbacks/", summary="Stream all feedback as NDJSON or CSV")
+async def export_feedbacks(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    after_id: Optional[int] = Query(None, ge=0, description="Id of the last row already received"),
+    limit: Optional[int] = Query(None, ge=1, description="Stop after this many rows; all rows if omitted"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    email: Optional[str] = None,
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    """Export admins only. Rows are streamed in id order; see export_service for paging."""
+    export_service.require_admin(current_user)
+    query = export_service.feedbacks_query(after_id, limit, start, end, email)
+    return export_service.streaming_response(query, export_service.FEEDBACK_COLUMNS, format, "feedbacks")
+
+
+@app.get("/export/diagnosis-logs/", summary="Stream diagnosis logs as NDJSON or CSV")
+async def export_diagnosis_logs(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    after_id: Optional[int] = Query(None, ge=0, description="Id of the last row already received"),
+    limit: Optional[int] = Query(None, ge=1, description="Stop after this many rows; all rows if omitted"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    disease_name: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    """
+    Export admins get every user's logs (optionally filtered by `owner_id`); everyone
+    else gets their own.
+    """
+    if not export_service.is_admin(current_user):
+        if owner_id is not None and owner_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Not allowed to export this data")
+        owner_id = current_user.id
+    query = export_service.diagnosis_logs_query(after_id, limit, start, end, disease_name, owner_id)
+    return export_service.streaming_response(query, export_service.DIAGNOSIS_LOG_COLUMNS, format, "diagnosis-logs")
+
 @app.post("/forgot-password-otp")
 def forgot_password_otp(email: str, db: Session = Depends(database.get_db)):
     user = db.query(database.User).filter(database.User.email == email).first()
@@ -238,10 +633,7 @@ def forgot_password_otp(email: str, db: Session = Depends(database.get_db)):
 
     otp = random.randint(100000, 999999)
 
-    database.otp_store[email] = {
-        "otp": otp,
-        "expires": datetime.utcnow() + timedelta(minutes=5)
-    }
+    otp_service.get_store().issue(email, otp)
 
     # 🔥 IMPORTANT FOR TESTING (CHECK RENDER LOGS)
     print("🔐 PASSWORD RESET OTP:", otp)
@@ -250,28 +642,33 @@ def forgot_password_otp(email: str, db: Session = Depends(database.get_db)):
 
 
 @app.post("/reset-password-otp")
-def reset_password_otp(
+async def reset_password_otp(
     email: str,
     otp: int,
     new_password: str,
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    data = database.otp_store.get(email)
+    # The database store locks the OTP row; keep that round trip off the event loop
+    outcome = await asyncio.to_thread(otp_service.get_store().verify, email, otp)
 
-    if not data:
+    if outcome == otp_service.OTP_MISSING:
         raise HTTPException(status_code=400, detail="OTP not requested")
 
-    if datetime.utcnow() > data["expires"]:
-        del database.otp_store[email]
+    if outcome == otp_service.OTP_EXPIRED:
         raise HTTPException(status_code=400, detail="OTP expired")
 
-    if data["otp"] != otp:
-        raise HTTPException(status_code=400, detail="Invalid OTP")
+    if outcome == otp_service.OTP_LOCKED:
+        raise HTTPException(status_code=429, detail="Too many invalid attempts, request a new OTP")
 
-    user = db.query(database.User).filter(database.User.email == email).first()
-    user.hashed_password = auth.get_password_hash(new_password)
-    db.commit()
+    if outcome != otp_service.OTP_OK:
+        raise HTTPException(status_code=400, detail="Invalid OTP")
 
-    del database.otp_store[email]
+    result = await db.execute(select(database.User).where(database.User.email == email).limit(1))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.hashed_password = await auth.get_password_hash_async(new_password)
+    await db.commit()
+    auth.invalidate_user(user.username)
 
     return {"message": "Password reset successful"}
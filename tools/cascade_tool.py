@@ -0,0 +1,207 @@
+# tools/cascade_tool.py
+"""
+Builds the small first-stage model of the cascade backend and picks its confidence
+threshold.
+
+    python -m tools.cascade_tool distill --images train_images
+    python -m tools.cascade_tool report --images test_images --output cascade.json
+
+`distill` trains a MobileNetV3-Small student on the full model's soft predictions
+over a directory of leaf images (no labels needed), then writes it as .h5 and as a
+float16 .tflite. `report` runs both models over evaluation images and lists, per
+threshold, how many images the first stage would answer, how often the cascade
+agrees with the full model and the expected cost per image. When the images sit in
+folders named after their class (as in PlantVillage), true accuracy is reported too.
+"""
+import os
+import sys
+import json
+import math
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import inference_backends  # noqa: E402
+from tools.tflite_tool import iter_image_paths, load_tensor, _timed_predict, _write  # noqa: E402
+
+CLASS_PATH = os.path.join(inference_backends.MODELS_DIR, "class_indices.json")
+STAGE1_KERAS_PATH = os.path.join(inference_backends.MODELS_DIR, "plant_disease_model_stage1.h5")
+DEFAULT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.97, 0.99)
+
+
+def _load_classes() -> dict:
+    with open(CLASS_PATH, "r") as f:
+        return {v: int(k) for k, v in json.load(f).items()}
+
+
+def _load_batch(paths: list) -> np.ndarray:
+    return np.stack([load_tensor(path) for path in paths])
+
+
+def _teacher_predictions(paths: list, batch_size: int) -> np.ndarray:
+    teacher = inference_backends.create_backend("keras")
+    outputs = []
+    for i in range(0, len(paths), batch_size):
+        outputs.append(teacher.predict(_load_batch(paths[i:i + batch_size])))
+        print(f"Labelled {min(i + batch_size, len(paths))}/{len(paths)} images with the full model")
+    return np.concatenate(outputs)
+
+
+def _build_student(num_classes: int, weights: str, alpha: float):
+    import tensorflow as tf
+
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    # The API feeds [0, 1] images; MobileNetV3 wants [-1, 1]
+    x = tf.keras.layers.Rescaling(2.0, offset=-1.0)(inputs)
+    base = tf.keras.applications.MobileNetV3Small(
+        input_shape=(224, 224, 3), alpha=alpha, include_top=False, pooling="avg",
+        weights=None if weights == "none" else weights, include_preprocessing=False,
+    )
+    x = base(x)
+    x = tf.keras.layers.Dropout(0.2)(x)
+    logits = tf.keras.layers.Dense(num_classes, name="logits")(x)
+    return tf.keras.Model(inputs, logits)
+
+
+def distill(args):
+    import tensorflow as tf
+
+    paths = list(iter_image_paths(args.images, args.limit))
+    if len(paths) < 2:
+        sys.exit(f"Need at least two images in {args.images}")
+    rng = np.random.default_rng(args.seed)
+    paths = [paths[i] for i in rng.permutation(len(paths))]
+    teacher_probs = _teacher_predictions(paths, args.batch_size)
+
+    num_val = max(1, int(len(paths) * args.val_split))
+    train_paths, val_paths = paths[num_val:], paths[:num_val]
+    train_probs, val_probs = teacher_probs[num_val:], teacher_probs[:num_val]
+
+    # Soften the teacher's distribution so the student also learns which classes look alike
+    temperature = args.temperature
+    soft_targets = np.exp(np.log(np.clip(train_probs, 1e-8, 1.0)) / temperature)
+    soft_targets /= soft_targets.sum(axis=1, keepdims=True)
+
+    class Batches(tf.keras.utils.Sequence):
+        def __len__(self):
+            return math.ceil(len(train_paths) / args.batch_size)
+
+        def __getitem__(self, i):
+            batch = _load_batch(train_paths[i * args.batch_size:(i + 1) * args.batch_size])
+            flip = rng.random(len(batch)) < 0.5
+            batch[flip] = batch[flip, :, ::-1]
+            return batch, soft_targets[i * args.batch_size:(i + 1) * args.batch_size]
+
+    def distillation_loss(targets, logits):
+        # Scaled by T^2 so the gradient size doesn't depend on the temperature
+        log_student = tf.nn.log_softmax(logits / temperature)
+        return -tf.reduce_sum(targets * log_student, axis=-1) * temperature ** 2
+
+    student = _build_student(teacher_probs.shape[1], args.weights, args.alpha)
+    student.compile(optimizer=tf.keras.optimizers.Adam(args.learning_rate), loss=distillation_loss)
+    student.fit(Batches(), epochs=args.epochs, verbose=2)
+
+    # Ship the student with a softmax, so it returns probabilities like the full model
+    model = tf.keras.Sequential([student, tf.keras.layers.Softmax()])
+    val_student = model.predict(_load_batch(val_paths), batch_size=args.batch_size, verbose=0)
+    agreement = float(np.mean(np.argmax(val_student, axis=1) == np.argmax(val_probs, axis=1)))
+    print(f"Top-1 agreement with the full model on {len(val_paths)} held-out images: {agreement:.3f}")
+
+    model.save(args.output_h5)
+    print(f"Wrote {args.output_h5}")
+    if args.output_tflite:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+        _write(args.output_tflite, converter.convert())
+
+
+def report(args):
+    paths = list(iter_image_paths(args.images, args.limit))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+    batch = _load_batch(paths)
+
+    stage1 = inference_backends.load_model_file("cascade-stage1", args.stage1)
+    stage2 = inference_backends.create_backend(args.stage2)
+    probs1, ms1 = _timed_predict(stage1, batch, args.batch_size)
+    probs2, ms2 = _timed_predict(stage2, batch, args.batch_size)
+    top1, top2 = np.argmax(probs1, axis=1), np.argmax(probs2, axis=1)
+    confidence = probs1.max(axis=1)
+
+    # Ground truth from the parent folder name, where it is a known class
+    classes = _load_classes()
+    labels = np.array([classes.get(os.path.basename(os.path.dirname(p)), -1) for p in paths])
+    labelled = labels >= 0
+
+    def accuracy(predicted):
+        return float(np.mean(predicted[labelled] == labels[labelled])) if labelled.any() else None
+
+    result = {
+        "images": len(paths),
+        "labelled_images": int(labelled.sum()),
+        "stage1": {"model": args.stage1, "ms_per_image": ms1, "accuracy": accuracy(top1),
+                   "agreement_with_full": float(np.mean(top1 == top2))},
+        "stage2": {"backend": args.stage2, "ms_per_image": ms2, "accuracy": accuracy(top2)},
+        "thresholds": [],
+    }
+    for threshold in args.thresholds:
+        exits = confidence >= threshold
+        cascade = np.where(exits, top1, top2)
+        # Every image pays for the first stage; only the uncertain ones for the second
+        ms = ms1 + (1 - exits.mean()) * ms2
+        result["thresholds"].append({
+            "threshold": threshold,
+            "stage1_hit_rate": float(exits.mean()),
+            "stage1_agreement_on_hits": float(np.mean(top1[exits] == top2[exits])) if exits.any() else None,
+            "agreement_with_full": float(np.mean(cascade == top2)),
+            "accuracy": accuracy(cascade),
+            "ms_per_image": ms,
+            "speedup": ms2 / ms if ms else None,
+        })
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_distill = sub.add_parser("distill", help="Train the first-stage model on the full model's predictions")
+    p_distill.add_argument("--images", required=True, help="Directory of training images (labels not needed)")
+    p_distill.add_argument("--epochs", type=int, default=10)
+    p_distill.add_argument("--batch-size", type=int, default=32)
+    p_distill.add_argument("--learning-rate", type=float, default=1e-3)
+    p_distill.add_argument("--temperature", type=float, default=2.0, help="Softening of the teacher's predictions")
+    p_distill.add_argument("--alpha", type=float, default=1.0, help="MobileNetV3-Small width multiplier")
+    p_distill.add_argument("--weights", default="imagenet", help="Initial weights: 'imagenet', 'none' or a file")
+    p_distill.add_argument("--val-split", type=float, default=0.1)
+    p_distill.add_argument("--limit", type=int, default=0, help="Use at most this many images")
+    p_distill.add_argument("--seed", type=int, default=0)
+    p_distill.add_argument("--output-h5", default=STAGE1_KERAS_PATH)
+    p_distill.add_argument("--output-tflite", default=inference_backends.CASCADE_STAGE1_MODEL_PATH,
+                           help="Also write a float16 TFLite model here; pass '' to skip")
+    p_distill.set_defaults(func=distill)
+
+    p_report = sub.add_parser("report", help="Hit rate, accuracy and cost of the cascade per threshold")
+    p_report.add_argument("--images", required=True, help="Directory of evaluation images")
+    p_report.add_argument("--stage1", default=inference_backends.CASCADE_STAGE1_MODEL_PATH)
+    p_report.add_argument("--stage2", choices=[b for b in inference_backends.BACKENDS if b != "cascade"],
+                          default=inference_backends.CASCADE_STAGE2_BACKEND)
+    p_report.add_argument("--thresholds", nargs="+", type=float, default=list(DEFAULT_THRESHOLDS))
+    p_report.add_argument("--batch-size", type=int, default=16)
+    p_report.add_argument("--limit", type=int, default=0, help="Use at most this many images")
+    p_report.add_argument("--output", help="Also write the JSON report to this file")
+    p_report.set_defaults(func=report)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
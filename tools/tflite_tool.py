@@ -0,0 +1,145 @@
+# tools/tflite_tool.py
+"""
+Converts the Keras model to quantized TFLite models and measures how far their
+predictions drift from the original.
+
+    python -m tools.tflite_tool convert --calibration-dir test_images
+    python -m tools.tflite_tool compare --images test_images --output drift.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import inference_backends  # noqa: E402
+from app.preprocessing_service import prepare_image  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def iter_image_paths(directory: str, limit: int = 0):
+    count = 0
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+                count += 1
+                if limit and count >= limit:
+                    return
+
+
+def load_tensor(path: str) -> np.ndarray:
+    """Preprocesses an image file exactly the way the API does."""
+    with open(path, "rb") as f:
+        return prepare_image(f.read()).tensor
+
+
+def convert(args):
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(inference_backends.KERAS_MODEL_PATH, compile=False)
+
+    if "fp16" in args.modes:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+        _write(inference_backends.TFLITE_MODEL_PATHS["tflite-fp16"], converter.convert())
+
+    if "int8" in args.modes:
+        if not args.calibration_dir:
+            sys.exit("int8 conversion needs --calibration-dir with sample leaf images")
+        paths = list(iter_image_paths(args.calibration_dir, args.num_calibration))
+        if not paths:
+            sys.exit(f"No images found in {args.calibration_dir}")
+
+        def representative_dataset():
+            for path in paths:
+                yield [np.expand_dims(load_tensor(path), axis=0)]
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        # Fall back to float kernels for any op without an int8 implementation
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+        ]
+        _write(inference_backends.TFLITE_MODEL_PATHS["tflite-int8"], converter.convert())
+        print(f"Calibrated int8 model on {len(paths)} images")
+
+
+def _write(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+    print(f"Wrote {path} ({len(data) / 1024:.1f} KiB)")
+
+
+def compare(args):
+    paths = list(iter_image_paths(args.images, args.limit))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+    batch = np.stack([load_tensor(path) for path in paths])
+
+    reference = inference_backends.create_backend("keras")
+    expected = _timed_predict(reference, batch, args.batch_size)
+
+    report = {"images": len(paths), "reference": "keras", "backends": {}}
+    report["backends"]["keras"] = {"ms_per_image": expected[1]}
+    for name in args.backends:
+        backend = inference_backends.create_backend(name)
+        probs, ms_per_image = _timed_predict(backend, batch, args.batch_size)
+        diff = np.abs(probs - expected[0])
+        report["backends"][name] = {
+            "top1_agreement": float(np.mean(np.argmax(probs, axis=1) == np.argmax(expected[0], axis=1))),
+            "mean_abs_prob_diff": float(diff.mean()),
+            "max_abs_prob_diff": float(diff.max()),
+            "mean_confidence_diff": float(np.mean(probs.max(axis=1) - expected[0].max(axis=1))),
+            "ms_per_image": ms_per_image,
+        }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+def _timed_predict(backend, batch: np.ndarray, batch_size: int):
+    backend.predict(batch[:batch_size])  # Warm up before timing
+    outputs = []
+    start = time.perf_counter()
+    for i in range(0, len(batch), batch_size):
+        outputs.append(backend.predict(batch[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    return np.concatenate(outputs), elapsed * 1000 / len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_convert = sub.add_parser("convert", help="Convert the .h5 model to quantized TFLite models")
+    p_convert.add_argument("--modes", nargs="+", choices=["fp16", "int8"], default=["fp16", "int8"])
+    p_convert.add_argument("--calibration-dir", help="Directory of sample images for int8 calibration")
+    p_convert.add_argument("--num-calibration", type=int, default=200)
+    p_convert.set_defaults(func=convert)
+
+    p_compare = sub.add_parser("compare", help="Measure prediction drift against the Keras model")
+    p_compare.add_argument("--images", required=True, help="Directory of evaluation images")
+    p_compare.add_argument("--backends", nargs="+", choices=list(inference_backends.TFLITE_MODEL_PATHS),
+                           default=list(inference_backends.TFLITE_MODEL_PATHS))
+    p_compare.add_argument("--batch-size", type=int, default=16)
+    p_compare.add_argument("--limit", type=int, default=0, help="Use at most this many images")
+    p_compare.add_argument("--output", help="Also write the JSON report to this file")
+    p_compare.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()